@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""admission.py
+
+Admission control for writes that contend on one entity group.
+
+When a popular conference opens, every registration is a transaction on
+the same Conference entity. Past about one write a second they start
+colliding, ndb retries them, and the retries add to the pile until every
+request on the instance is slow. An AdmissionController puts a cap in
+front of that, per key (the conference):
+
+- a token bucket in memcache limits how many attempts start per window.
+  Instances lease tokens from it a few at a time and spend them from
+  memory, so most admissions make no memcache call at all;
+- an in-flight counter caps how many transactions run at once, both per
+  instance and (in memcache) across instances.
+
+A request that doesn't get in waits up to max_wait for a slot. After
+that it is shed with Rejected, which carries a retry-after hint. The
+admitted, queued and shed counts go to memcache per minute and can be
+read back with metrics().
+
+If memcache is unavailable the shared limits are skipped (fail open) and
+only the per-instance in-flight cap applies.
+
+"""
+
+import collections
+import contextlib
+import logging
+import math
+import threading
+import time
+
+from google.appengine.api import memcache
+
+METRICS = ('admitted', 'queued', 'shed_rate', 'shed_inflight')
+METRICS_FLUSH_SECONDS = 5
+# a leaked in-flight count (instance killed mid-request) lasts at most
+# this long, since each slot has its own counter
+INFLIGHT_SLOT_SECONDS = 30
+POLL_SECONDS = 0.05
+
+
+class Rejected(Exception):
+
+    """Rejected -- the request was shed; retry after retry_after seconds"""
+
+    def __init__(self, reason, retry_after):
+        Exception.__init__(self, reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def _incr(mkey, delta, expires):
+    """memcache.incr, creating the counter with an expiry on first use;
+    None if memcache is unavailable."""
+    value = memcache.incr(mkey, delta=delta)
+    if value is None:
+        memcache.add(mkey, 0, time=expires)
+        value = memcache.incr(mkey, delta=delta)
+    return value
+
+
+class AdmissionController(object):
+
+    """AdmissionController -- rate and concurrency limits per key"""
+
+    def __init__(self, name, rate, max_inflight, max_wait=1.0, lease=5,
+                 window=1):
+        self.name = name
+        self.rate = rate                # attempts per window, all instances
+        self.max_inflight = max_inflight
+        self.max_wait = max_wait
+        self.lease = lease
+        self.window = window
+        self._lock = threading.Lock()
+        self._tokens = {}               # key -> (window number, tokens)
+        self._inflight = collections.defaultdict(int)
+        self._counts = collections.defaultdict(int)
+        self._flushed = time.time()
+
+    @contextlib.contextmanager
+    def admit(self, key):
+        """Hold an admission for key for the duration of the block."""
+        deadline = time.time() + self.max_wait
+        queued = False
+        while True:
+            reason, wait = self._tryAdmit(key)
+            if reason is None:
+                slot = wait
+                break
+            if time.time() + wait > deadline:
+                self._count(key, 'shed_' + reason)
+                self._maybeFlush()
+                raise Rejected(reason, max(1, int(math.ceil(wait))))
+            if not queued:
+                queued = True
+                self._count(key, 'queued')
+            time.sleep(wait)
+
+        self._count(key, 'admitted')
+        try:
+            yield
+        finally:
+            self._exit(key, slot)
+            self._maybeFlush()
+
+    def _tryAdmit(self, key):
+        """Return (None, in-flight slot) once admitted, else (reason,
+        seconds until a retry could succeed)."""
+        now = time.time()
+        # take the slot first, so waiting for one doesn't spend tokens
+        slot = self._enter(key, now)
+        if slot is False:
+            return 'inflight', POLL_SECONDS
+        if not self._takeToken(key, now):
+            self._exit(key, slot)
+            return 'rate', self.window - now % self.window
+        return None, slot
+
+    def _takeToken(self, key, now):
+        window = int(now // self.window)
+        with self._lock:
+            w, tokens = self._tokens.get(key, (None, 0))
+            if w == window and tokens > 0:
+                self._tokens[key] = (w, tokens - 1)
+                return True
+
+        # lease a few tokens from this window's shared bucket
+        mkey = 'ADMISSION TOKENS %s %s %d' % (self.name, key, window)
+        taken = _incr(mkey, self.lease, self.window * 2 + 1)
+        if taken is None:
+            return True
+        granted = min(self.lease, self.rate - (taken - self.lease))
+        if granted <= 0:
+            return False
+        with self._lock:
+            w, tokens = self._tokens.get(key, (None, 0))
+            self._tokens[key] = (window,
+                                 (tokens if w == window else 0) + granted - 1)
+        return True
+
+    def _enter(self, key, now):
+        """Take an in-flight slot; return the shared counter it was
+        taken on (None if memcache is down), or False if full."""
+        with self._lock:
+            if self._inflight[key] >= self.max_inflight:
+                return False
+            self._inflight[key] += 1
+
+        mkey = 'ADMISSION INFLIGHT %s %s %d' % (
+            self.name, key, int(now // INFLIGHT_SLOT_SECONDS))
+        running = _incr(mkey, 1, INFLIGHT_SLOT_SECONDS * 2)
+        if running is not None and running > self.max_inflight:
+            memcache.decr(mkey)
+            self._exit(key, None)
+            return False
+        return mkey if running is not None else None
+
+    def _exit(self, key, mkey):
+        if mkey:
+            memcache.decr(mkey)
+        with self._lock:
+            self._inflight[key] -= 1
+            if not self._inflight[key]:
+                del self._inflight[key]
+
+    def _count(self, key, metric):
+        minute = int(time.time() // 60)
+        with self._lock:
+            self._counts[(key, metric, minute)] += 1
+
+    def _maybeFlush(self):
+        """Send the counts to memcache every few seconds, and prune the
+        leased tokens of past windows."""
+        now = time.time()
+        with self._lock:
+            if now - self._flushed < METRICS_FLUSH_SECONDS:
+                return
+            self._flushed = now
+            counts, self._counts = self._counts, collections.defaultdict(int)
+            window = int(now // self.window)
+            for key in [k for k, (w, _) in self._tokens.items()
+                        if w != window]:
+                del self._tokens[key]
+
+        shed = sum(n for (_, metric, _), n in counts.items()
+                   if metric.startswith('shed_'))
+        if shed:
+            logging.warning('%s admission shed %d requests in the last '
+                            '%d seconds', self.name, shed,
+                            METRICS_FLUSH_SECONDS)
+        memcache.offset_multi(
+            dict((self._metricKey(*k), n) for k, n in counts.items()),
+            initial_value=0)
+
+    def _metricKey(self, key, metric, minute):
+        return 'ADMISSION METRIC %s %s %s %d' % (self.name, key, metric,
+                                                 minute)
+
+    def metrics(self, key, minutes=5):
+        """Return [(minute, {metric: count})] for key over the last few
+        minutes, newest first. Instances report every few seconds, so
+        the current minute may lag slightly."""
+        now = int(time.time() // 60)
+        span = range(now, now - minutes, -1)
+        keys = [self._metricKey(key, metric, minute)
+                for minute in span for metric in METRICS]
+        values = memcache.get_multi(keys)
+        return [(minute * 60, dict(
+            (metric, values.get(self._metricKey(key, metric, minute), 0))
+            for metric in METRICS)) for minute in span]
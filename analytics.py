@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""analytics.py
+
+Vectorized aggregates behind the conference stats reports.
+
+The build_stats job streams Conference and Profile entities in cursor
+batches into a Columns object. Columns keeps compact typed arrays: one
+slot per conference, plus one per (conference, topic) pair and one per
+registration. compute() turns them into NumPy arrays and works out every
+aggregate in a handful of vector operations:
+
+- registrations per conference (a bincount of the registration column);
+- fill rate, and its percentile among conferences with a capacity;
+- registrations per hour since the previous build;
+- per topic: conferences, registrations, capacity, fill rate and rank.
+
+numpy is only imported by this module, so only the job loads it.
+
+"""
+
+import array
+
+import numpy as np
+
+
+class Columns(object):
+
+    """Columns -- conference and registration data as typed arrays"""
+
+    def __init__(self):
+        self.keys = []                          # websafe conference keys
+        self._index = {}
+        self.capacity = array.array('i')
+        self.prevRegistered = array.array('i')
+        self.prevGenerated = array.array('d')   # epoch seconds, 0 if none
+        self.topics = []
+        self._topicIndex = {}
+        self.topicConference = array.array('i')
+        self.topicId = array.array('i')
+        self.attending = array.array('i')       # conference per registration
+
+    def addConference(self, key, capacity, topics, previous=None):
+        """Add a conference; previous is its last (registered, epoch
+        seconds) report, if any."""
+        i = self._index[key] = len(self.keys)
+        self.keys.append(key)
+        self.capacity.append(capacity or 0)
+        registered, generated = previous or (0, 0)
+        self.prevRegistered.append(registered)
+        self.prevGenerated.append(generated)
+        for topic in set(topics or []):
+            t = self._topicIndex.get(topic)
+            if t is None:
+                t = self._topicIndex[topic] = len(self.topics)
+                self.topics.append(topic)
+            self.topicConference.append(i)
+            self.topicId.append(t)
+
+    def addRegistrations(self, keys):
+        """Add one user's registrations, by websafe conference key."""
+        for key in keys:
+            i = self._index.get(key)
+            if i is not None:
+                self.attending.append(i)
+
+
+def _column(values, dtype):
+    """Read a typed array into numpy without going through a list."""
+    if not len(values):
+        return np.zeros(0, dtype=dtype)
+    return np.frombuffer(values, dtype=values.typecode).astype(dtype)
+
+
+def _counts(index, size, weights=None):
+    if not len(index):
+        return np.zeros(size)
+    return np.bincount(index, weights=weights, minlength=size)
+
+
+def _ratio(num, den):
+    """num / den where den > 0, else nan."""
+    return np.where(den > 0, num / np.maximum(den, 1e-9), np.nan)
+
+
+def _value(x):
+    """A float for the datastore, None for nan."""
+    return None if np.isnan(x) else float(x)
+
+
+def compute(columns, now):
+    """Return ({websafe key: conference stats}, {topic: topic stats})
+    for the gathered columns; now is the build time in epoch seconds."""
+    n = len(columns.keys)
+    if not n:
+        return {}, {}
+
+    capacity = _column(columns.capacity, np.float64)
+    registered = _counts(_column(columns.attending, np.intp), n)
+
+    fill = _ratio(registered, capacity)
+    rated = np.sort(fill[~np.isnan(fill)])
+    percentile = np.where(
+        np.isnan(fill), np.nan,
+        100.0 * np.searchsorted(rated, fill, 'right') / max(len(rated), 1))
+
+    prev_registered = _column(columns.prevRegistered, np.float64)
+    prev_generated = _column(columns.prevGenerated, np.float64)
+    hours = np.where(prev_generated > 0, (now - prev_generated) / 3600.0, 0)
+    velocity = _ratio(registered - prev_registered, hours)
+
+    conferences = dict(
+        (key, {'registered': int(registered[i]),
+               'capacity': int(capacity[i]),
+               'fillRate': _value(fill[i]),
+               'fillRatePercentile': _value(percentile[i]),
+               'registrationsPerHour': _value(velocity[i])})
+        for i, key in enumerate(columns.keys))
+
+    m = len(columns.topics)
+    topic_conf = _column(columns.topicConference, np.intp)
+    topic_id = _column(columns.topicId, np.intp)
+    counts = _counts(topic_id, m)
+    topic_registered = _counts(topic_id, m, registered[topic_conf])
+    topic_capacity = _counts(topic_id, m, capacity[topic_conf])
+    topic_fill = _ratio(topic_registered, topic_capacity)
+    # rank 1 is the topic with the most registrations
+    rank = np.empty(m, dtype=np.intp)
+    rank[np.argsort(-topic_registered, kind='mergesort')] = np.arange(1, m + 1)
+
+    topics = dict(
+        (topic, {'conferences': int(counts[t]),
+                 'registered': int(topic_registered[t]),
+                 'capacity': int(topic_capacity[t]),
+                 'fillRate': _value(topic_fill[t]),
+                 'rank': int(rank[t])})
+        for t, topic in enumerate(columns.topics))
+    return conferences, topics
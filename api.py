@@ -1,20 +1,44 @@
 #!/usr/bin/env python
 
 from datetime import datetime
+from datetime import timedelta
+import base64
+import hashlib
+import json
+import logging
+import uuid
+import zlib
 import endpoints
 from protorpc import messages
 from protorpc import message_types
 from protorpc import remote
 from google.appengine.api import memcache
-from google.appengine.api import taskqueue
 from google.appengine.ext import ndb
 
+import admission
+import geo
+import idpool
+import planner
 from exceptions import *
 from models import *
 from forms import *
 from utils import *
 from settings import *
 
+# Conferences and Sessions are children of the organizer's Profile, and
+# ids are allocated per parent, so each organizer has their own pool
+CONFERENCE_IDS = idpool.IdPools(Conference)
+SESSION_IDS = idpool.IdPools(Session)
+
+# registrations contend on the conference's entity group, so cap how
+# fast and how many of them run at once per conference
+REGISTRATION = admission.AdmissionController(
+    'registration', rate=REGISTRATION_RATE,
+    max_inflight=REGISTRATION_MAX_INFLIGHT, max_wait=REGISTRATION_MAX_WAIT)
+
+# kinds served by syncChanges, in the order a sync pass walks them
+SYNC_MODELS = [Conference, Session, Speaker, Tombstone]
+
 
 @endpoints.api(name='conference',
                version='v1',
@@ -39,6 +63,10 @@ class ConferenceApi(remote.Service):
                 setattr(cf, field.name, conf.key.urlsafe())
         if displayName:
             setattr(cf, 'organizerDisplayName', displayName)
+        cf.etag = str(conf.version or 0)
+        if conf.location:
+            cf.latitude = conf.location.lat
+            cf.longitude = conf.location.lon
         cf.check_initialized()
         return cf
 
@@ -55,6 +83,13 @@ class ConferenceApi(remote.Service):
                 for field in request.all_fields()}
         del data['websafeKey']
         del data['organizerDisplayName']
+        # response-only fields
+        del data['etag']
+        del data['notModified']
+        del data['attending']
+        del data['latitude']
+        del data['longitude']
+        del data['distanceKm']
 
         for df in DEFAULTS:
             if data[df] in (None, []):
@@ -74,15 +109,17 @@ class ConferenceApi(remote.Service):
         if data["maxAttendees"] > 0:
             data["seatsAvailable"] = data["maxAttendees"]
         p_key = ndb.Key(Profile, user_id)
-        c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
-        c_key = ndb.Key(Conference, c_id, parent=p_key)
+        c_key = ndb.Key(Conference, CONFERENCE_IDS.next(p_key), parent=p_key)
         data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
 
-        Conference(**data).put()
-        taskqueue.add(params={'email': user.email(),
-                              'conferenceInfo': repr(request)},
-                      url='/tasks/send_confirmation_email')
+        conf = Conference(**data)
+        conf.put()
+        self._queueFacetDelta(
+            self._facetDelta(conf, 1, conf.seatsAvailable or 0))
+        queueTask(params={'email': user.email(),
+                          'conferenceInfo': repr(request)},
+                  url='/tasks/send_confirmation_email')
         return request
 
     @ndb.transactional()
@@ -102,6 +139,7 @@ class ConferenceApi(remote.Service):
             raise endpoints.ForbiddenException(
                 'Only the owner can update the conference.')
 
+        delta = self._facetDelta(conf, -1, -(conf.seatsAvailable or 0))
         for field in request.all_fields():
             data = getattr(request, field.name)
             if data not in (None, []):
@@ -112,6 +150,9 @@ class ConferenceApi(remote.Service):
                 # write to Conference object
                 setattr(conf, field.name, data)
         conf.put()
+        self._queueFacetDelta(
+            self._facetDelta(conf, 1, conf.seatsAvailable or 0, delta),
+            transactional=True)
         prof = ndb.Key(Profile, user_id).get()
         return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
@@ -119,6 +160,7 @@ class ConferenceApi(remote.Service):
                       path='conference',
                       http_method='POST',
                       name='createConference')
+    @ndb.toplevel
     def createConference(self, request):
         """Create new conference."""
         return self._createConferenceObject(request)
@@ -131,21 +173,201 @@ class ConferenceApi(remote.Service):
         """Update conference w/provided fields & return w/updated info."""
         return self._updateConferenceObject(request)
 
-    @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
+    @endpoints.method(CONF_VERSIONED_GET_REQUEST, ConferenceForm,
                       path='conference/{websafeConferenceKey}',
                       http_method='GET',
                       name='getConference')
     def getConference(self, request):
-        """Return requested conference (by websafeConferenceKey)."""
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        """Return requested conference (by websafeConferenceKey), or just
+        notModified if the ifNoneMatch etag is still current."""
+        wsck = request.websafeConferenceKey
+        cache_key = Conference.VERSION_CACHE_KEY % wsck
+        if request.ifNoneMatch and \
+                memcache.get(cache_key) == request.ifNoneMatch:
+            return ConferenceForm(websafeKey=wsck, etag=request.ifNoneMatch,
+                                  notModified=True)
+
+        conf = ndb.Key(urlsafe=wsck).get()
         if not conf:
-            k = request.websafeConferenceKey
             raise endpoints.NotFoundException(
-                'No conference found with key: %s' % k)
+                'No conference found with key: %s' % wsck)
+        # add, not set: a write committed since our get has already
+        # published a newer version
+        memcache.add(cache_key, str(conf.version or 0))
         prof = conf.key.parent().get()
         # return ConferenceForm
         return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
 
+    @staticmethod
+    def _keysFromWebsafe(websafe_keys, model):
+        """Decode websafe keys of one kind, dropping duplicates."""
+        if len(websafe_keys) > MAX_BATCH_KEYS:
+            raise endpoints.BadRequestException(
+                'At most %d websafeKeys per request' % MAX_BATCH_KEYS)
+        keys = []
+        for wsk in websafe_keys:
+            try:
+                key = ndb.Key(urlsafe=wsk)
+            except Exception:
+                raise endpoints.BadRequestException('Invalid key: %s' % wsk)
+            if key.kind() != model._get_kind():
+                raise endpoints.BadRequestException(
+                    'Not a %s key: %s' % (model._get_kind(), wsk))
+            if key not in keys:
+                keys.append(key)
+        return keys
+
+    @endpoints.method(WebsafeKeysForm, ConferenceForms,
+                      path='conferences/batch',
+                      http_method='POST',
+                      name='getConferences')
+    def getConferences(self, request):
+        """Return the requested conferences (by websafeKeys) in one
+        round trip, flagging the ones the caller is registered for."""
+        c_keys = self._keysFromWebsafe(request.websafeKeys, Conference)
+        user = endpoints.get_current_user()
+        p_key = ndb.Key(Profile, getUserId(user)) if user else None
+
+        entities = ndb.get_multi(c_keys + ([p_key] if p_key else []))
+        prof = entities.pop() if p_key else None
+        confs = [conf for conf in entities if conf]
+
+        organisers = list(set(conf.key.parent() for conf in confs))
+        n = dict((p.key.id(), p.displayName)
+                 for p in ndb.get_multi(organisers) if p)
+
+        attending = set(prof.conferenceKeysToAttend) if prof else set()
+        items = []
+        for conf in confs:
+            cf = self._copyConferenceToForm(conf, n.get(conf.organizerUserId))
+            if user:
+                cf.attending = conf.key.urlsafe() in attending
+            items.append(cf)
+        return ConferenceForms(items=items)
+
+    @endpoints.method(WebsafeKeysForm, SessionForms,
+                      path='sessions/batch',
+                      http_method='POST',
+                      name='getSessions')
+    def getSessions(self, request):
+        """Return the requested sessions (by websafeKeys) in one get."""
+        check_auth()
+        s_keys = self._keysFromWebsafe(request.websafeKeys, Session)
+        return SessionForms(items=[self._copySessionToForm(s)
+                                   for s in ndb.get_multi(s_keys) if s])
+
+    @staticmethod
+    def _decodeSyncToken(token):
+        """Return the sync state carried by a token."""
+        try:
+            state = json.loads(base64.urlsafe_b64decode(str(token)))
+            # since is None while a full sync is paging
+            since, start = [
+                datetime.strptime(state[f], SYNC_TIME_FORMAT)
+                if state.get(f) else None for f in ('since', 'start')]
+            cursor = state.get('cursor')
+            if cursor:
+                cursor = ndb.Cursor(urlsafe=cursor)
+            return {'since': since, 'start': start,
+                    'kind': int(state.get('kind', 0)), 'cursor': cursor}
+        except Exception:
+            raise endpoints.BadRequestException('Invalid sync token.')
+
+    @staticmethod
+    def _encodeSyncToken(since, start=None, kind=0, cursor=None):
+        fmt = lambda d: d.strftime(SYNC_TIME_FORMAT) if d else None
+        return base64.urlsafe_b64encode(json.dumps({
+            'since': fmt(since), 'start': fmt(start), 'kind': kind,
+            'cursor': cursor.urlsafe() if cursor else None}))
+
+    @staticmethod
+    def _syncQuery(model, since):
+        """Entities of model changed after since; everything if None."""
+        if since is None:
+            return model.query().order(model.key)
+        prop = Tombstone.deleted if model is Tombstone else model.updated
+        return model.query(prop > since).order(prop)
+
+    def _addSyncItems(self, response, model, entities):
+        if model is Conference:
+            organisers = list(set(conf.key.parent() for conf in entities))
+            n = dict((p.key.id(), p.displayName)
+                     for p in ndb.get_multi(organisers) if p)
+            response.conferences.extend(
+                self._copyConferenceToForm(conf, n.get(conf.organizerUserId))
+                for conf in entities)
+        elif model is Session:
+            response.sessions.extend(
+                self._copySessionToForm(s) for s in entities)
+        elif model is Speaker:
+            response.speakers.extend(
+                self._copySpeakerToForm(s) for s in entities)
+        else:
+            response.deleted.extend(
+                TombstoneForm(kind=t.kind, websafeKey=t.websafeKey)
+                for t in entities)
+
+    @endpoints.method(SyncRequestForm, SyncForm,
+                      path='sync',
+                      http_method='POST',
+                      name='syncChanges')
+    def syncChanges(self, request):
+        """Return a page of the conferences, sessions and speakers
+        changed or deleted since syncToken."""
+        check_auth()
+        now = datetime.utcnow()
+        response = SyncForm(reset=False)
+        if request.syncToken:
+            state = self._decodeSyncToken(request.syncToken)
+            retention = timedelta(days=TOMBSTONE_RETENTION_DAYS)
+            if state['since'] and state['since'] < now - retention:
+                # deletes this old are no longer recorded
+                state = None
+                response.reset = True
+        else:
+            state = None
+        if state is None:
+            state = {'since': None, 'start': None, 'kind': 0, 'cursor': None}
+        start = state['start'] or now
+
+        page_size = min(request.pageSize or SYNC_PAGE_SIZE, SYNC_PAGE_SIZE)
+        kind, cursor = state['kind'], state['cursor']
+        while kind < len(SYNC_MODELS):
+            model = SYNC_MODELS[kind]
+            if model is Tombstone and state['since'] is None:
+                kind += 1
+                continue
+            entities, next_cursor, more = self._syncQuery(
+                model, state['since']).fetch_page(page_size,
+                                                  start_cursor=cursor)
+            self._addSyncItems(response, model, entities)
+            if more:
+                cursor = next_cursor
+                break
+            kind, cursor = kind + 1, None
+            if entities:
+                break
+
+        response.more = kind < len(SYNC_MODELS)
+        if response.more:
+            response.syncToken = self._encodeSyncToken(
+                state['since'], start, kind, cursor)
+        else:
+            response.syncToken = self._encodeSyncToken(
+                start - timedelta(seconds=SYNC_OVERLAP_SECONDS))
+        return response
+
+    @staticmethod
+    def _purgeTombstones(batch_size=500):
+        """Delete tombstones past the retention window; used by the
+        purge_tombstones cron job."""
+        cutoff = datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+        q = Tombstone.query(Tombstone.deleted < cutoff)
+        keys = q.fetch(batch_size, keys_only=True)
+        while keys:
+            ndb.delete_multi(keys)
+            keys = q.fetch(batch_size, keys_only=True)
+
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
                       path='getConferencesCreated',
                       http_method='POST',
@@ -162,24 +384,70 @@ class ConferenceApi(remote.Service):
         )
 
     def _getQuery(self, request):
-        """Return formatted query from the submitted filters."""
-
-        q = Conference.query()
+        """Return a QueryPlan for the submitted filters."""
         inequality_filter, filters = self._formatFilters(request.filters)
 
-        if not inequality_filter:
-            q = q.order(Conference.name)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
-
+        query_filters = []
+        memory_filters = []
         for filtr in filters:
+            if filtr["field"] == "startDate":
+                continue
             if filtr["field"] in ["month", "maxAttendees"]:
                 filtr["value"] = int(filtr["value"])
-            formatted_query = ndb.query.FilterNode(
-                filtr["field"], filtr["operator"], filtr["value"])
-            q = q.filter(formatted_query)
-        return q
+            query_filters.append(filtr)
+
+        date_filters = [f for f in filters if f["field"] == "startDate"]
+        date_range = self._dateRange(date_filters)
+        if date_range:
+            buckets = Conference.dateBucketsForRange(*date_range)
+            if buckets is None:
+                raise endpoints.BadRequestException(
+                    "Date range is too long.")
+            query_filters.append({"field": "dateBuckets", "operator": "IN",
+                                  "value": buckets})
+            # buckets are coarser than the range, trim the edges
+            memory_filters.append({"field": "startDate", "operator": ">=",
+                                   "value": date_range[0]})
+            memory_filters.append({"field": "startDate", "operator": "<=",
+                                   "value": date_range[1]})
+
+        return self._plan(Conference, query_filters, "name", memory_filters)
+
+    def _plan(self, model, filters, order, memory_filters=()):
+        """Plan a filter query, mapping bad fields to a 400."""
+        try:
+            return planner.plan(model, filters, order, memory_filters)
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
+
+    def _dateRange(self, date_filters):
+        """Turn startDate filters into an inclusive (start, end) range."""
+        if not date_filters:
+            return None
+        start = end = None
+        for filtr in date_filters:
+            try:
+                value = datetime.strptime(
+                    filtr["value"][:10], "%Y-%m-%d").date()
+            except (TypeError, ValueError):
+                raise endpoints.BadRequestException(
+                    "Invalid start date value")
+            op = filtr["operator"]
+            if op == "!=":
+                raise endpoints.BadRequestException(
+                    "Start date does not support the NE operator.")
+            if op == ">":
+                value += timedelta(days=1)
+            elif op == "<":
+                value -= timedelta(days=1)
+            if op in ("=", ">", ">="):
+                start = max(start, value) if start else value
+            if op in ("=", "<", "<="):
+                end = min(end, value) if end else value
+        if not (start and end):
+            raise endpoints.BadRequestException(
+                "Start date filters need both a lower and an upper bound.")
+        return start, end
 
     def _formatFilters(self, filters):
         """Parse, check validity and format user supplied filters."""
@@ -197,7 +465,8 @@ class ConferenceApi(remote.Service):
                 raise endpoints.BadRequestException(
                     "Filter contains invalid field or operator.")
 
-            if filtr["operator"] != "=":
+            # startDate ranges run on the bucket index, not an inequality
+            if filtr["operator"] != "=" and filtr["field"] != "startDate":
                 if inequality_field and inequality_field != filtr["field"]:
                     raise endpoints.BadRequestException(
                         "Inequality filter is allowed on only one field.")
@@ -213,7 +482,7 @@ class ConferenceApi(remote.Service):
                       name='queryConferences')
     def queryConferences(self, request):
         """Query for conferences."""
-        c = self._getQuery(request)
+        c = self._getQuery(request).run()
 
         organisers = [(ndb.Key(Profile, conf.organizerUserId))
                       for conf in c]
@@ -227,6 +496,361 @@ class ConferenceApi(remote.Service):
             items=[self._copyConferenceToForm(i,
                                               n[i.organizerUserId]) for i in c])
 
+    @endpoints.method(ConferenceNearForm, ConferenceNearForms,
+                      path='conferences/near',
+                      http_method='POST',
+                      name='searchConferencesNear')
+    def searchConferencesNear(self, request):
+        """Return conferences within radiusKm of a city or point, nearest
+        first, a page at a time."""
+        if request.latitude is not None and request.longitude is not None:
+            lat, lng = request.latitude, request.longitude
+        elif request.city:
+            point = geo.locate(request.city)
+            if not point:
+                raise endpoints.BadRequestException(
+                    'Unknown city: %s' % request.city)
+            lat, lng = point
+        else:
+            raise endpoints.BadRequestException(
+                "Either 'city' or 'latitude' and 'longitude' required")
+        radius = request.radiusKm or NEAR_DEFAULT_RADIUS_KM
+        if not 0 < radius <= NEAR_MAX_RADIUS_KM:
+            raise endpoints.BadRequestException(
+                'radiusKm must be between 0 and %d' % NEAR_MAX_RADIUS_KM)
+        try:
+            offset = int(request.pageToken or 0)
+        except ValueError:
+            raise endpoints.BadRequestException('Invalid pageToken')
+        size = request.pageSize or NEAR_PAGE_SIZE
+
+        # the covering cells over-select; trim to the circle exactly
+        cells = geo.coveringCells(lat, lng, radius, NEAR_MAX_CELLS)
+        near = []
+        for conf in Conference.query(Conference.geohashes.IN(cells)):
+            d = geo.distanceKm(lat, lng, conf.location.lat, conf.location.lon)
+            if d <= radius:
+                near.append((d, conf))
+        near.sort(key=lambda n: (n[0], n[1].name))
+        page = near[offset:offset + size]
+
+        profiles = ndb.get_multi(list(set(
+            ndb.Key(Profile, conf.organizerUserId) for _, conf in page)))
+        names = dict((p.key.id(), p.displayName) for p in profiles if p)
+        items = []
+        for d, conf in page:
+            cf = self._copyConferenceToForm(
+                conf, names.get(conf.organizerUserId))
+            cf.distanceKm = round(d, 1)
+            items.append(cf)
+        more = offset + size < len(near)
+        return ConferenceNearForms(
+            items=items, nextPageToken=str(offset + size) if more else None)
+
+    @staticmethod
+    def _backfillConferences(batch_size=100):
+        """Fill in the dateBuckets and location of conferences stored
+        before those existed, or whose city the gazetteer has since
+        learned; used by the backfill_conferences cron job."""
+        q = Conference.query()
+        cursor, more = None, True
+        while more:
+            confs, cursor, more = q.fetch_page(batch_size,
+                                               start_cursor=cursor)
+            for conf in confs:
+                # | rather than or: both must run
+                if conf.bucketDates() | conf.locate():
+                    ConferenceApi._backfillConference(conf.key)
+
+    @staticmethod
+    @ndb.transactional()
+    def _backfillConference(c_key):
+        """Re-read a stale conference and write it back in one
+        transaction, so registrations committed since the page was
+        read aren't overwritten."""
+        conf = c_key.get()
+        if conf and conf.bucketDates() | conf.locate():
+            conf.put()
+
+    @staticmethod
+    def _buildConferenceStats(batch_size=500):
+        """Recompute the ConferenceStats and TopicStats reports; used by
+        the build_stats cron job."""
+        # numpy is loaded by this job only, never on the request path
+        import analytics
+        now = datetime.utcnow()
+        epoch = datetime(1970, 1, 1)
+        columns = analytics.Columns()
+
+        q = Conference.query()
+        cursor, more = None, True
+        while more:
+            confs, cursor, more = q.fetch_page(batch_size,
+                                               start_cursor=cursor)
+            previous = ndb.get_multi([ndb.Key(ConferenceStats,
+                                              conf.key.urlsafe())
+                                      for conf in confs])
+            for conf, prev in zip(confs, previous):
+                prev = ((prev.registered or 0,
+                         (prev.generated - epoch).total_seconds())
+                        if prev and prev.generated else None)
+                columns.addConference(conf.key.urlsafe(), conf.maxAttendees,
+                                      conf.topics, prev)
+
+        q = Profile.query()
+        cursor, more = None, True
+        while more:
+            profiles, cursor, more = q.fetch_page(batch_size,
+                                                  start_cursor=cursor)
+            for prof in profiles:
+                columns.addRegistrations(prof.conferenceKeysToAttend)
+
+        conferences, topics = analytics.compute(
+            columns, (now - epoch).total_seconds())
+        stats = [ConferenceStats(key=ndb.Key(ConferenceStats, wsck),
+                                 generated=now, **values)
+                 for wsck, values in conferences.items()]
+        for i in range(0, len(stats), batch_size):
+            ndb.put_multi(stats[i:i + batch_size])
+        TopicStats(id=TopicStats.ID, topics=topics, generated=now).put()
+
+    @endpoints.method(CONF_GET_REQUEST, ConferenceStatsForm,
+                      path='conference/{websafeConferenceKey}/stats',
+                      http_method='GET',
+                      name='getConferenceStats')
+    def getConferenceStats(self, request):
+        """Return the latest analytics report for a conference (owner
+        only)."""
+        user_id = check_auth()
+        wsck = request.websafeConferenceKey
+        conf, stats, topic_stats = ndb.get_multi([
+            ndb.Key(urlsafe=wsck), ndb.Key(ConferenceStats, wsck),
+            ndb.Key(TopicStats, TopicStats.ID)])
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        if user_id != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can see the conference stats.')
+        if not stats:
+            raise endpoints.NotFoundException(
+                'No stats yet for conference: %s' % wsck)
+
+        topics = topic_stats.topics if topic_stats else {}
+        topic_forms = []
+        for topic in conf.topics:
+            if topic in topics:
+                t = topics[topic]
+                topic_forms.append(TopicStatsForm(
+                    topic=topic, conferences=t['conferences'],
+                    registered=t['registered'], fillRate=t['fillRate'],
+                    rank=t['rank']))
+        return ConferenceStatsForm(
+            websafeKey=wsck,
+            registered=stats.registered,
+            capacity=stats.capacity,
+            fillRate=stats.fillRate,
+            fillRatePercentile=stats.fillRatePercentile,
+            registrationsPerHour=stats.registrationsPerHour,
+            topics=topic_forms,
+            generated=stats.generated.isoformat())
+
+    @staticmethod
+    def _facetDelta(conf, count, seats, delta=None):
+        """Add conf's contribution to each facet bucket into delta."""
+        delta = delta if delta is not None else {}
+        for field in FACET_FIELDS.values():
+            values = getattr(conf, field)
+            if not isinstance(values, list):
+                values = [values]
+            for value in set(v for v in values if v is not None):
+                bucket = delta.setdefault(field, {}).setdefault(
+                    str(value), [0, 0])
+                bucket[0] += count
+                bucket[1] += seats
+        return delta
+
+    @staticmethod
+    def _queueFacetDelta(delta, transactional=False):
+        """Queue a facet delta on the pull queue that the
+        apply_facet_deltas cron job drains in batches."""
+        queuePullTask(FACET_QUEUE, json.dumps(delta),
+                      transactional=transactional)
+
+    @staticmethod
+    @ndb.transactional()
+    def _mergeFacetDelta(delta):
+        """Merge a facet delta into the stored ConferenceFacets."""
+        key = ndb.Key(ConferenceFacets, FACETS_ID)
+        facets = key.get() or ConferenceFacets(key=key)
+        counts = facets.counts or {}
+        for field, buckets in delta.items():
+            stored = counts.setdefault(field, {})
+            for value, (count, seats) in buckets.items():
+                bucket = stored.get(value, [0, 0])
+                bucket = [bucket[0] + count, bucket[1] + seats]
+                # deltas arrive in any order, so keep a bucket until it
+                # nets out; a seat change may precede the conference
+                if bucket != [0, 0]:
+                    stored[value] = bucket
+                else:
+                    stored.pop(value, None)
+        facets.counts = counts
+        facets.put()
+        return counts
+
+    @staticmethod
+    def _applyFacetDeltas(lease_seconds=60):
+        """Drain the facet delta queue, merging each leased batch into
+        one write on ConferenceFacets; used by the apply_facet_deltas
+        cron job."""
+        from google.appengine.api import taskqueue
+        queue = taskqueue.Queue(FACET_QUEUE)
+        while True:
+            tasks = queue.lease_tasks(lease_seconds, FACET_LEASE_BATCH)
+            if not tasks:
+                return
+            merged = {}
+            for task in tasks:
+                for field, buckets in json.loads(task.payload).items():
+                    for value, (count, seats) in buckets.items():
+                        bucket = merged.setdefault(field, {}).setdefault(
+                            value, [0, 0])
+                        bucket[0] += count
+                        bucket[1] += seats
+            counts = ConferenceApi._mergeFacetDelta(merged)
+            memcache.set(MEMCACHE_FACETS_KEY, counts)
+            queue.delete_tasks(tasks)
+            if len(tasks) < FACET_LEASE_BATCH:
+                return
+
+    @staticmethod
+    def _rebuildFacets():
+        """Recount all facets from scratch; used by the facets cron job
+        to correct any drift in the incremental counts.
+        """
+        counts = {}
+        for conf in Conference.query():
+            ConferenceApi._facetDelta(conf, 1, conf.seatsAvailable or 0,
+                                      counts)
+        ConferenceFacets(key=ndb.Key(ConferenceFacets, FACETS_ID),
+                         counts=counts).put()
+        memcache.set(MEMCACHE_FACETS_KEY, counts)
+        return counts
+
+    @staticmethod
+    def _getFacetCounts():
+        """Return the facet counts from memcache, filling it on a miss."""
+        counts = memcache.get(MEMCACHE_FACETS_KEY)
+        if counts is None:
+            facets = ndb.Key(ConferenceFacets, FACETS_ID).get()
+            counts = facets.counts if facets else {}
+            memcache.set(MEMCACHE_FACETS_KEY, counts)
+        return counts
+
+    @endpoints.method(message_types.VoidMessage, FacetForms,
+                      path='conferenceFacets',
+                      http_method='GET',
+                      name='getConferenceFacets')
+    def getConferenceFacets(self, request):
+        """Return conference counts and seats left per filter value."""
+        counts = self._getFacetCounts()
+        items = []
+        for name, field in sorted(FACET_FIELDS.items()):
+            buckets = counts.get(field, {})
+            items.append(FacetForm(field=name, buckets=[
+                FacetBucketForm(value=value, count=bucket[0],
+                                seatsAvailable=bucket[1])
+                for value, bucket in sorted(buckets.items())
+                if bucket[0] > 0]))
+        return FacetForms(items=items)
+
+    @staticmethod
+    def _catalogItem(conf, displayName):
+        """Public subset of a Conference for the catalog snapshot."""
+        return {
+            'websafeKey': conf.key.urlsafe(),
+            'name': conf.name,
+            'description': conf.description,
+            'topics': conf.topics,
+            'city': conf.city,
+            'startDate': str(conf.startDate),
+            'endDate': str(conf.endDate),
+            'month': conf.month,
+            'maxAttendees': conf.maxAttendees,
+            'seatsAvailable': conf.seatsAvailable,
+            'organizerDisplayName': displayName,
+        }
+
+    @staticmethod
+    def _buildCatalog():
+        """Regenerate the paged public catalog snapshot; used by the
+        build_catalog task.
+        """
+        confs = Conference.query().order(Conference.name).fetch()
+        organisers = list(set(ndb.Key(Profile, conf.organizerUserId)
+                              for conf in confs))
+        n = dict((prof.key.id(), prof.displayName)
+                 for prof in ndb.get_multi(organisers) if prof)
+        items = [ConferenceApi._catalogItem(conf, n.get(conf.organizerUserId))
+                 for conf in confs]
+
+        etag = hashlib.md5(json.dumps(items, sort_keys=True)).hexdigest()[:12]
+        c_key = ndb.Key(Catalog, Catalog.ID)
+        old = c_key.get()
+        if old and old.etag == etag:
+            return old
+
+        size = CATALOG_PAGE_SIZE
+        page_count = max(1, (len(items) + size - 1) // size)
+        pages = []
+        for page in range(page_count):
+            body = json.dumps({'items': items[page * size:(page + 1) * size],
+                               'page': page, 'pageCount': page_count},
+                              separators=(',', ':'))
+            pages.append(CatalogPage(
+                key=ndb.Key(CatalogPage, '%s-%d' % (etag, page), parent=c_key),
+                data=zlib.compress(body)))
+        ndb.put_multi(pages)
+        catalog = Catalog(key=c_key, etag=etag, pageCount=page_count)
+        catalog.put()
+
+        memcache.set_multi(dict((p.key.id(), p.data) for p in pages),
+                           key_prefix=MEMCACHE_CATALOG_PAGE_KEY % '')
+        memcache.set(MEMCACHE_CATALOG_KEY, (etag, page_count))
+        ndb.delete_multi([k for k in CatalogPage.query(ancestor=c_key).fetch(
+            keys_only=True) if not k.id().startswith(etag + '-')])
+        return catalog
+
+    @staticmethod
+    def _getCatalogPage(page):
+        """Return (etag, pageCount, JSON) for a catalog page, None if no
+        snapshot has been built yet, or (etag, pageCount, None) if page
+        is out of range.
+        """
+        meta = memcache.get(MEMCACHE_CATALOG_KEY)
+        if meta is None:
+            catalog = ndb.Key(Catalog, Catalog.ID).get()
+            if not catalog:
+                return None
+            meta = (catalog.etag, catalog.pageCount)
+            memcache.add(MEMCACHE_CATALOG_KEY, meta)
+        etag, page_count = meta
+        if not 0 <= page < page_count:
+            return etag, page_count, None
+
+        page_id = '%s-%d' % (etag, page)
+        data = memcache.get(MEMCACHE_CATALOG_PAGE_KEY % page_id)
+        if data is None:
+            p = ndb.Key(Catalog, Catalog.ID, CatalogPage, page_id).get()
+            if not p:
+                # superseded between reading meta and page
+                memcache.delete(MEMCACHE_CATALOG_KEY)
+                return None
+            data = p.data
+            memcache.add(MEMCACHE_CATALOG_PAGE_KEY % page_id, data)
+        return etag, page_count, zlib.decompress(data)
+
     def _copyProfileToForm(self, prof):
         """Copy relevant fields from Profile to ProfileForm."""
         pf = ProfileForm()
@@ -300,14 +924,23 @@ class ConferenceApi(remote.Service):
             memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
         return announcement
 
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+    @staticmethod
+    def _versionedString(data, if_none_match):
+        """Wrap a cached string with an etag of its content."""
+        raw = data.encode('utf-8') if isinstance(data, unicode) else data
+        etag = hashlib.md5(raw).hexdigest()[:12]
+        if if_none_match == etag:
+            return VersionedStringMessage(etag=etag, notModified=True)
+        return VersionedStringMessage(data=data, etag=etag)
+
+    @endpoints.method(VERSIONED_GET_REQUEST, VersionedStringMessage,
                       path='conference/announcement/get',
                       http_method='GET',
                       name='getAnnouncement')
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
         d = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or ""
-        return StringMessage(data=d)
+        return self._versionedString(d, request.ifNoneMatch)
 
     @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg=True):
@@ -344,6 +977,10 @@ class ConferenceApi(remote.Service):
 
         prof.put()
         conf.put()
+        if retval:
+            self._queueFacetDelta(
+                self._facetDelta(conf, 0, -1 if reg else 1),
+                transactional=True)
         return BooleanMessage(data=retval)
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
@@ -373,7 +1010,8 @@ class ConferenceApi(remote.Service):
                       name='registerForConference')
     def registerForConference(self, request):
         """Register user for selected conference."""
-        return self._conferenceRegistration(request)
+        return self._admitRegistration(request.websafeConferenceKey,
+                                       self._conferenceRegistration, request)
 
     @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
                       path='conference/{websafeConferenceKey}',
@@ -381,7 +1019,159 @@ class ConferenceApi(remote.Service):
                       name='unregisterFromConference')
     def unregisterFromConference(self, request):
         """Unregister user for selected conference."""
-        return self._conferenceRegistration(request, reg=False)
+        return self._admitRegistration(request.websafeConferenceKey,
+                                       self._conferenceRegistration,
+                                       request, reg=False)
+
+    def _admitRegistration(self, wsck, register, *args, **kwargs):
+        """Run a registration once admission control lets it in; shed it
+        with a retry-after hint when the conference is overloaded."""
+        try:
+            with REGISTRATION.admit(wsck):
+                return register(*args, **kwargs)
+        except admission.Rejected as e:
+            raise OverloadedException(
+                'Registration for this conference is busy. '
+                'Retry after %d seconds.' % e.retry_after)
+
+    @endpoints.method(CONF_GET_REQUEST, AdmissionMetricForms,
+                      path='conference/{websafeConferenceKey}/admission',
+                      http_method='GET',
+                      name='getRegistrationMetrics')
+    def getRegistrationMetrics(self, request):
+        """Return the last five minutes of registration admission counts
+        for a conference (owner only)."""
+        user_id = check_auth()
+        wsck = request.websafeConferenceKey
+        conf = ndb.Key(urlsafe=wsck).get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        if user_id != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can see the registration metrics.')
+
+        return AdmissionMetricForms(items=[
+            AdmissionMetricForm(
+                minute=datetime.utcfromtimestamp(minute).isoformat(),
+                admitted=counts['admitted'], queued=counts['queued'],
+                shedRate=counts['shed_rate'],
+                shedInflight=counts['shed_inflight'])
+            for minute, counts in REGISTRATION.metrics(wsck)])
+
+    @staticmethod
+    @ndb.transactional()
+    def _reserveSeats(c_key, count):
+        """Take up to count seats from a conference in one transaction."""
+        conf = c_key.get()
+        granted = max(0, min(count, conf.seatsAvailable))
+        if granted:
+            conf.seatsAvailable -= granted
+            conf.put()
+            ConferenceApi._queueFacetDelta(
+                ConferenceApi._facetDelta(conf, 0, -granted),
+                transactional=True)
+        return granted
+
+    @staticmethod
+    @ndb.transactional()
+    def _returnSeats(c_key, count):
+        """Give back seats reserved by _reserveSeats but not used."""
+        conf = c_key.get()
+        conf.seatsAvailable += count
+        conf.put()
+        ConferenceApi._queueFacetDelta(
+            ConferenceApi._facetDelta(conf, 0, count), transactional=True)
+
+    @staticmethod
+    @ndb.tasklet
+    def _addRegistrationAsync(p_key, wsck):
+        """Append a conference to one Profile in its own transaction.
+        Resolves to True if added, False if the user was already
+        registered and None if the transaction failed."""
+        @ndb.tasklet
+        def txn():
+            prof = yield p_key.get_async()
+            if wsck in prof.conferenceKeysToAttend:
+                raise ndb.Return(False)
+            prof.conferenceKeysToAttend.append(wsck)
+            yield prof.put_async()
+            raise ndb.Return(True)
+        try:
+            added = yield ndb.transaction_async(txn)
+        except Exception:
+            logging.exception('Registering %s for %s failed',
+                              p_key.id(), wsck)
+            added = None
+        raise ndb.Return(added)
+
+    def _groupRegistration(self, request):
+        """Register a list of users for a conference, one result per user."""
+        user_id = check_auth()
+
+        wsck = request.websafeConferenceKey
+        c_key = ndb.Key(urlsafe=wsck)
+        conf = c_key.get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        if user_id != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can register a group for the conference.')
+
+        # de-duplicate while keeping the caller's order for the results
+        user_ids = []
+        for uid in request.userIds:
+            if uid and uid not in user_ids:
+                user_ids.append(uid)
+
+        profiles = ndb.get_multi([ndb.Key(Profile, uid) for uid in user_ids])
+        results = {}
+        pending = []
+        for uid, prof in zip(user_ids, profiles):
+            if not prof:
+                results[uid] = (False, 'No such user')
+            elif wsck in prof.conferenceKeysToAttend:
+                results[uid] = (False, 'Already registered')
+            else:
+                pending.append(uid)
+
+        granted = self._reserveSeats(c_key, len(pending)) if pending else 0
+        for uid in pending[granted:]:
+            results[uid] = (False, 'There are no seats available.')
+
+        # each Profile is appended in its own transaction, so concurrent
+        # writes to it aren't lost; seats that weren't used go back
+        used = 0
+        try:
+            futures = [self._addRegistrationAsync(ndb.Key(Profile, uid), wsck)
+                       for uid in pending[:granted]]
+            for uid, future in zip(pending, futures):
+                added = future.get_result()
+                if added:
+                    used += 1
+                    results[uid] = (True, '')
+                elif added is False:
+                    results[uid] = (False, 'Already registered')
+                else:
+                    results[uid] = (False, 'Registration failed, try again.')
+        finally:
+            if granted > used:
+                self._returnSeats(c_key, granted - used)
+
+        return RegistrationResultForms(items=[
+            RegistrationResultForm(userId=uid, registered=results[uid][0],
+                                   message=results[uid][1])
+            for uid in user_ids])
+
+    @endpoints.method(CONF_GROUP_REQUEST, RegistrationResultForms,
+                      path='conference/{websafeConferenceKey}/group',
+                      http_method='POST',
+                      name='registerGroupForConference')
+    def registerGroupForConference(self, request):
+        """Register a group of users for selected conference."""
+        return self._admitRegistration(request.websafeConferenceKey,
+                                       self._groupRegistration, request)
 
     def _copySpeakerToForm(self, speaker):
         """Copy relevant fields from Speaker to SpeakerForm."""
@@ -389,6 +1179,7 @@ class ConferenceApi(remote.Service):
         for field in sf.all_fields():
             if hasattr(speaker, field.name):
                 setattr(sf, field.name, getattr(speaker, field.name))
+        sf.speaker_id = speaker.key.id()
         sf.check_initialized()
         return sf
 
@@ -401,7 +1192,9 @@ class ConferenceApi(remote.Service):
 
         data = {field.name: getattr(request, field.name)
                 for field in request.all_fields()}
-        Speaker(**data).put()
+        del data['speaker_id']
+        data['organizerUserId'] = user_id
+        request.speaker_id = Speaker(**data).put().id()
         return request
 
     @endpoints.method(SpeakerForm, SpeakerForm,
@@ -412,6 +1205,93 @@ class ConferenceApi(remote.Service):
         """Create a new Speaker"""
         return self._createSpeakerObject(request)
 
+    @endpoints.method(SpeakerForm, SpeakerForm,
+                      path='speaker/update',
+                      http_method='POST',
+                      name='update_speaker')
+    def update_speaker(self, request):
+        """Rename a Speaker; their sessions catch up in a task."""
+        user_id = check_auth()
+        if not request.name:
+            raise endpoints.BadRequestException(
+                "Speaker 'name' field required")
+        speaker = ndb.Key(Speaker, request.speaker_id).get() \
+            if request.speaker_id else None
+        if not speaker:
+            raise endpoints.NotFoundException(
+                'No speaker found with id: %s' % request.speaker_id)
+        # sessions are children of their organizer's Profile
+        if user_id != speaker.organizerUserId and not Session.query(
+                Session.speaker_id == speaker.key,
+                ancestor=ndb.Key(Profile, user_id)).get(keys_only=True):
+            raise endpoints.ForbiddenException(
+                'Only the creator of the speaker or an organizer of one of '
+                'their sessions can rename them.')
+
+        if speaker.name != request.name:
+            speaker.name = request.name
+            speaker.put()
+            queueTask(params={'speaker_id': request.speaker_id},
+                      url='/tasks/propagate_speaker_name')
+        return self._copySpeakerToForm(speaker)
+
+    @staticmethod
+    def _propagateSpeakerName(speaker_id, batch_size=100):
+        """Copy a Speaker's name onto speaker_name of their sessions and
+        refresh the affected agendas; used by the propagate task.
+        """
+        speaker = ndb.Key(Speaker, int(speaker_id)).get()
+        if not speaker:
+            return
+        q = Session.query(Session.speaker_id == speaker.key)
+        cursor, more = None, True
+        while more:
+            sessions, cursor, more = q.fetch_page(batch_size,
+                                                  start_cursor=cursor)
+            stale = [s for s in sessions if s.speaker_name != speaker.name]
+            for s in stale:
+                s.speaker_name = speaker.name
+            ndb.put_multi(stale)
+            for s in stale:
+                ConferenceApi._refreshAgenda(s)
+
+    @staticmethod
+    def _buildSpeakerRoster(conference_key):
+        """Build a conference's missing SpeakerRoster from its sessions.
+        A roster stored meanwhile wins: it may hold a session the
+        (eventually consistent) query can't see yet."""
+        speakers = {}
+        for s in Session.query(Session.conference_key == conference_key):
+            if s.speaker_id:
+                speakers.setdefault(str(s.speaker_id.id()), []).append(
+                    s.key.urlsafe())
+        return SpeakerRoster.get_or_insert(conference_key, speakers=speakers)
+
+    @staticmethod
+    @ndb.transactional()
+    def _addToSpeakerRoster(conference_key, speaker_key, session_key):
+        """Record a session against its speaker in an existing roster,
+        returning how many sessions the speaker now has there."""
+        roster = ndb.Key(SpeakerRoster, conference_key).get()
+        speakers = roster.speakers or {}
+        sessions = speakers.setdefault(str(speaker_key.id()), [])
+        if session_key.urlsafe() not in sessions:
+            sessions.append(session_key.urlsafe())
+            roster.speakers = speakers
+            roster.put()
+        return len(sessions)
+
+    @staticmethod
+    def _updateSpeakerRoster(session):
+        """Bring the session's conference SpeakerRoster up to date after a
+        session write, returning the speaker's session count."""
+        if not session.speaker_id:
+            return 0
+        if not ndb.Key(SpeakerRoster, session.conference_key).get():
+            ConferenceApi._buildSpeakerRoster(session.conference_key)
+        return ConferenceApi._addToSpeakerRoster(
+            session.conference_key, session.speaker_id, session.key)
+
     @endpoints.method(SPEAKER_REQUEST, SpeakerForms,
                       path='speakers/{websafeConferenceKey}',
                       http_method='POST',
@@ -419,33 +1299,29 @@ class ConferenceApi(remote.Service):
     def get_speakers(self, request):
         """Return all Speakers for given Conference."""
         user_id = check_auth()
-        sessions = Session.query(
-            Session.conference_key == request.websafeConferenceKey)
-        speakers = ndb.get_multi([i.speaker_id for i in sessions])
+        wsck = request.websafeConferenceKey
+        roster = ndb.Key(SpeakerRoster, wsck).get() \
+            or self._buildSpeakerRoster(wsck)
+        speakers = ndb.get_multi([ndb.Key(Speaker, int(speaker_id))
+                                  for speaker_id in sorted(
+                                      roster.speakers or {}, key=int)])
 
         return SpeakerForms(
-            items=[self._copySpeakerToForm(s) for s in speakers])
-
-    @staticmethod
-    def _checkFeaturedSpeaker(confKey, speaker):
-        """Checks featured speaker"""
-        q = Session.query(ndb.AND(
-            Session.speaker_id == speaker,
-            Session.conference_key == confKey))
-        return True if q.count() >= 2 else False
+            items=[self._copySpeakerToForm(s) for s in speakers if s])
 
     @staticmethod
     def _setFeaturedSpeaker(confKey, speaker_id):
         """Sets memcache Featured Speakers announcement"""
-        speaker = ndb.Key(Speaker, int(speaker_id))
-        q = Session.query(ndb.AND(
-            Session.speaker_id == speaker,
-            Session.conference_key == confKey))
-        sessions = [i.title for i in q]
-
-        if q.count() >= 2:
+        roster = ndb.Key(SpeakerRoster, confKey).get() \
+            or ConferenceApi._buildSpeakerRoster(confKey)
+        s_keys = (roster.speakers or {}).get(str(speaker_id), [])
+
+        if len(s_keys) >= 2:
+            entities = ndb.get_multi([ndb.Key(Speaker, int(speaker_id))] +
+                                     [ndb.Key(urlsafe=k) for k in s_keys])
+            speaker, sessions = entities[0], entities[1:]
             speakerAnounncement = FEATURED_SPEAKER % (
-                speaker.get().name, ', '.join(sessions))
+                speaker.name, ', '.join(s.title for s in sessions if s))
             memcache.set(MEMCACHE_SPEAKER_KEY, speakerAnounncement)
         return True
 
@@ -466,6 +1342,70 @@ class ConferenceApi(remote.Service):
         sf.check_initialized()
         return sf
 
+    @staticmethod
+    def _agendaEntry(s):
+        """Session to the SessionForm fields kept in its Agenda."""
+        entry = {
+            'websafeKey': s.key.urlsafe(),
+            'conference_key': s.conference_key,
+            'title': s.title,
+            'session_type': s.session_type,
+            'highlights': s.highlights,
+            'organizer_id': s.organizer_id,
+            'speaker_name': s.speaker_name,
+            'start_time': s.start_time and s.start_time.strftime('%H:%M'),
+            'duration': s.duration,
+            'location': s.location,
+        }
+        return dict((k, v) for k, v in entry.items() if v is not None)
+
+    @staticmethod
+    def _agendaOrder(entry):
+        return (entry.get('start_time') or '', entry.get('title'))
+
+    @staticmethod
+    def _buildAgenda(conference_key):
+        """Build a conference's missing Agenda from its sessions. An
+        Agenda stored meanwhile wins: it may hold a session the
+        (eventually consistent) query can't see yet."""
+        sessions = Session.query(Session.conference_key == conference_key)
+        entries = sorted((ConferenceApi._agendaEntry(s) for s in sessions),
+                         key=ConferenceApi._agendaOrder)
+        return Agenda.get_or_insert(conference_key, sessions=entries)
+
+    @staticmethod
+    @ndb.transactional()
+    def _upsertAgenda(conference_key, entry):
+        """Insert or replace one session in an existing Agenda."""
+        agenda = ndb.Key(Agenda, conference_key).get()
+        entries = [e for e in agenda.sessions or []
+                   if e['websafeKey'] != entry['websafeKey']]
+        entries.append(entry)
+        agenda.sessions = sorted(entries, key=ConferenceApi._agendaOrder)
+        agenda.put()
+
+    @staticmethod
+    def _refreshAgenda(session):
+        """Bring the session's conference Agenda up to date after a
+        session write."""
+        if not ndb.Key(Agenda, session.conference_key).get():
+            ConferenceApi._buildAgenda(session.conference_key)
+        # the rebuild's query may not see this write yet
+        ConferenceApi._upsertAgenda(session.conference_key,
+                                    ConferenceApi._agendaEntry(session))
+
+    @staticmethod
+    def _agendaForms(conference_key, match=None):
+        """Return a conference's sessions as SessionForms, in start_time
+        order, from its Agenda."""
+        if not conference_key:
+            return []
+        agenda = ndb.Key(Agenda, conference_key).get()
+        if not agenda:
+            agenda = ConferenceApi._buildAgenda(conference_key)
+        return [SessionForm(**entry) for entry in agenda.sessions or []
+                if match is None or match(entry)]
+
     def _createSessionObject(self, request):
         """Create or update Session object, returning SessionForm/request."""
         user_id = check_auth()
@@ -481,22 +1421,25 @@ class ConferenceApi(remote.Service):
 
         data = {field.name: getattr(request, field.name)
                 for field in request.all_fields()}
+        del data['websafeKey']
 
         data['start_time'] = datetime.strptime(
             data['start_time'], '%H:%M').time()
 
+        speaker = ndb.Key(Speaker, request.speaker_id).get_async()
         p_key = ndb.Key(Profile, user_id)
-        s_id = Session.allocate_ids(size=1, parent=p_key)[0]
-        s_key = ndb.Key(Session, s_id, parent=p_key)
+        s_key = ndb.Key(Session, SESSION_IDS.next(p_key), parent=p_key)
         data['key'] = s_key
         data['organizer_id'] = request.organizer_id = user_id
         data['speaker_id'] = ndb.Key(Speaker, request.speaker_id)
-        data['speaker_name'] = ndb.Key(Speaker, request.speaker_id).get().name
-
-        Session(**data).put()
-        key = 'speaker_id'
-        if self._checkFeaturedSpeaker(request.conference_key, data[key]):
-            taskqueue.add(params={
+        data['speaker_name'] = speaker.get_result().name
+
+        session = Session(**data)
+        session.put()
+        self._refreshAgenda(session)
+        request.websafeKey = s_key.urlsafe()
+        if self._updateSpeakerRoster(session) >= 2:
+            queueTask(params={
                 'speaker_id': request.speaker_id,
                 'conf': request.conference_key},
                 url='/tasks/set_featured_speaker')
@@ -506,6 +1449,7 @@ class ConferenceApi(remote.Service):
                       path='session/new',
                       http_method='POST',
                       name='new_session')
+    @ndb.toplevel
     def new_session(self, request):
         """Creates new session"""
         return self._createSessionObject(request)
@@ -517,11 +1461,26 @@ class ConferenceApi(remote.Service):
     def conference_sessions(self, request):
         """Returns session conference."""
         user_id = check_auth()
-        query = Session.query().filter(
-            Session.conference_key == request.conference_key)
+        etag = self._sessionListEtag(request.conference_key)
+        if request.ifNoneMatch == etag:
+            return SessionForms(etag=etag, notModified=True)
 
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in query])
+            items=self._agendaForms(request.conference_key), etag=etag)
+
+    @staticmethod
+    def _sessionListEtag(conference_key):
+        """Return the etag of a conference's session list, minting one
+        if session writes have expired it. Taken before the sessions are
+        read, so a write landing in between makes it stale, never current.
+        """
+        cache_key = Session.LIST_VERSION_CACHE_KEY % conference_key
+        etag = memcache.get(cache_key)
+        if etag is None:
+            etag = uuid.uuid4().hex[:12]
+            if not memcache.add(cache_key, etag):
+                etag = memcache.get(cache_key) or etag
+        return etag
 
     @endpoints.method(SessionByLocationForm, SessionForms,
                       path='sessions/location',
@@ -530,13 +1489,9 @@ class ConferenceApi(remote.Service):
     def sessions_by_location(self, request):
         """Returns session search by location"""
         user_id = check_auth()
-        q = Session.query().filter(
-            Session.conference_key == request.conference_key).filter(
-            Session.location == request.location)
-
-        return SessionForms(
-            items=[self._copySessionToForm(session) for session in q]
-        )
+        return SessionForms(items=self._agendaForms(
+            request.conference_key,
+            lambda entry: entry.get('location') == request.location))
 
     @endpoints.method(SessionByTypeForm, SessionForms,
                       path='sessions/type',
@@ -545,34 +1500,24 @@ class ConferenceApi(remote.Service):
     def sessions_by_type(self, request):
         """Returns session search by type"""
         user_id = check_auth()
-        q = Session.query().filter(
-            Session.conference_key == request.conference_key).filter(
-            Session.session_type == request.session_type)
-
-        return SessionForms(
-            items=[self._copySessionToForm(session) for session in q]
-        )
+        return SessionForms(items=self._agendaForms(
+            request.conference_key,
+            lambda entry: entry.get('session_type') == request.session_type))
 
-    @endpoints.method(SPEAKER_REQUEST, StringMessage,
+    @endpoints.method(FEATURED_SPEAKER_REQUEST, VersionedStringMessage,
                       path='speaker/featured',
                       http_method='GET',
                       name='featured_speaker')
     def featured_speaker(self, request):
         """Returns featured speaker"""
-        return StringMessage(data=memcache.get(MEMCACHE_SPEAKER_KEY) or "")
+        return self._versionedString(
+            memcache.get(MEMCACHE_SPEAKER_KEY) or "", request.ifNoneMatch)
 
     def _getSessionQuery(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Session.query()
+        """Return a QueryPlan for the submitted filters."""
         inequality_filter, filters = self._sessionFormatFilters(
             request.filters)
 
-        if not inequality_filter:
-            q = q.order(Session.title)
-        else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Session.title)
-
         for f in filters:
             if f["field"] == "duration":
                 try:
@@ -588,25 +1533,7 @@ class ConferenceApi(remote.Service):
                 except:
                     raise endpoints.BadRequestException(
                         "Invalid start time value")
-
-                if f['operator'] == '=':
-                    q = q.filter(Session.start_time == f['value'])
-                elif f['operator'] == '>':
-                    q = q.filter(Session.start_time > f['value'])
-                elif f['operator'] == '>=':
-                    q = q.filter(Session.start_time >= f['value'])
-                elif f['operator'] == '<':
-                    q = q.filter(Session.start_time < f['value'])
-                elif f['operator'] == '<=':
-                    q = q.filter(Session.start_time <= f['value'])
-                elif f['operator'] == '!=':
-                    q = q.filter(Session.start_time != f['value'])
-
-            if f["field"] != "start_time":
-                formatted_query = ndb.query.FilterNode(
-                    f["field"], f['operator'], f['value'])
-                q = q.filter(formatted_query)
-        return q
+        return self._plan(Session, filters, "title")
 
     def _sessionFormatFilters(self, filters):
         """Parse, check validity and format user supplied filters."""
@@ -641,7 +1568,7 @@ class ConferenceApi(remote.Service):
                       name='session_query')
     def session_query(self, request):
         """Query for sessions"""
-        s = self._getSessionQuery(request)
+        s = self._getSessionQuery(request).run()
         return SessionForms(items=[self._copySessionToForm(i) for i in s])
 
     @endpoints.method(message_types.VoidMessage, SessionForms,
@@ -658,19 +1585,220 @@ class ConferenceApi(remote.Service):
         return SessionForms(items=[self._copySessionToForm(s) for s in sesh])
 
     def _updateWishlist(self, request, register=True, msg=True):
-        """Add or Remove session from wishlist."""
+        """Add or Remove session from wishlist. The change is buffered and
+        written together with the user's other changes in the window."""
         prof = self._getProfileFromUser()
+        wishlist = self._wishlistView(prof)
+        wssk = self._wishlistSessionKey(request, wishlist)
+
+        if register:
+            if not wssk:
+                raise endpoints.BadRequestException(
+                    "'websafeSessionKey' field required")
+            if wssk in wishlist:
+                return BooleanMessage(data=msg)
+            if not ndb.Key(urlsafe=wssk).get():
+                raise endpoints.NotFoundException(
+                    'No session found with key: %s' % wssk)
+        elif wssk not in wishlist:
+            return BooleanMessage(data=False)
+
+        op = [uuid.uuid4().hex, 'add' if register else 'remove', wssk]
+        buffered = self._bufferWishlistOp(prof.key.id(), op)
+        if not buffered:
+            # memcache unavailable: write through
+            self._commitWishlistOps(prof.key, [op])
+        elif buffered >= WISHLIST_MAX_BUFFERED_OPS:
+            # bound what an eviction could lose
+            self._flushWishlist(prof.key.id())
+        return BooleanMessage(data=msg)
+
+    @staticmethod
+    def _wishlistSessionKey(request, wishlist):
+        """Return the websafe key of the request's session. A bare
+        sessionKey id is only resolved against the wishlist itself."""
+        if request.websafeSessionKey:
+            try:
+                key = ndb.Key(urlsafe=request.websafeSessionKey)
+            except Exception:
+                raise endpoints.BadRequestException(
+                    'Invalid key: %s' % request.websafeSessionKey)
+            if key.kind() != Session._get_kind():
+                raise endpoints.BadRequestException(
+                    'Not a Session key: %s' % request.websafeSessionKey)
+            return key.urlsafe()
+        for wssk in wishlist:
+            if ndb.Key(urlsafe=wssk).id() == request.sessionKey:
+                return wssk
+        return None
 
-        if register and request.sessionKey not in prof.sessionKeysToAttend:
-            prof.sessionKeysToAttend.append(request.sessionKey)
-        elif not register:
-            if request.sessionKey in prof.sessionKeysToAttend:
-                prof.sessionKeysToAttend.remove(request.sessionKey)
+    @staticmethod
+    def _bufferWishlistOp(user_id, op, retries=5):
+        """Append an op to the user's wishlist buffer and make sure a
+        flush is scheduled; return the number of ops now buffered, or 0
+        if it couldn't be buffered."""
+        client = memcache.Client()
+        key = MEMCACHE_WISHLIST_OPS_KEY % user_id
+        for _ in range(retries):
+            current = client.gets(key)
+            ops = (current or []) + [op]
+            if current is None:
+                buffered = client.add(key, ops)
             else:
-                msg = False
+                buffered = client.cas(key, ops)
+            if buffered:
+                break
+        else:
+            return 0
 
-        prof.put()
-        return BooleanMessage(data=msg)
+        if memcache.add(MEMCACHE_WISHLIST_FLUSH_KEY % user_id, 1,
+                        time=WISHLIST_FLUSH_SECONDS * 4):
+            queueTask(params={'user_id': user_id},
+                      url='/tasks/flush_wishlist',
+                      countdown=WISHLIST_FLUSH_SECONDS)
+        return len(ops)
+
+    @staticmethod
+    def _wishlistView(prof):
+        """Return the websafe keys of the user's wishlisted sessions, with
+        buffered changes applied."""
+        wishlist = [key.urlsafe() for key in prof.sessionsToAttend]
+        for _, action, wssk in memcache.get(
+                MEMCACHE_WISHLIST_OPS_KEY % prof.key.id()) or []:
+            if action == 'add' and wssk not in wishlist:
+                wishlist.append(wssk)
+            elif action == 'remove' and wssk in wishlist:
+                wishlist.remove(wssk)
+        return wishlist
+
+    @staticmethod
+    def _commitWishlistOps(p_key, ops, clear_legacy=False):
+        """Apply wishlist ops to the profile and schedules in one write.
+        Sessions live in their organizer's entity group, so they are read
+        before the transaction, which only touches the user's group."""
+        # skip bare ids buffered before ops carried websafe keys
+        ops = [op for op in ops if isinstance(op[2], basestring)]
+        keys = list(set(ndb.Key(urlsafe=wssk) for _, _, wssk in ops))
+        sessions = dict(zip(keys, ndb.get_multi(keys)))
+        ConferenceApi._applyWishlistOps(p_key, ops, sessions, clear_legacy)
+
+    @staticmethod
+    @ndb.transactional()
+    def _applyWishlistOps(p_key, ops, sessions, clear_legacy=False):
+        prof = p_key.get()
+        schedules = {}
+
+        for _, action, wssk in ops:
+            s_key = ndb.Key(urlsafe=wssk)
+            session = sessions[s_key]
+            schedule = ConferenceApi._getSchedule(p_key, session)
+            if schedule:
+                schedule = schedules.setdefault(schedule.key, schedule)
+
+            if action == 'add' and s_key not in prof.sessionsToAttend:
+                prof.sessionsToAttend.append(s_key)
+                if schedule:
+                    start, end = ConferenceApi._sessionInterval(session)
+                    schedule.add(s_key.urlsafe(), start, end)
+            elif action == 'remove' and s_key in prof.sessionsToAttend:
+                prof.sessionsToAttend.remove(s_key)
+                if schedule:
+                    schedule.remove(s_key.urlsafe())
+
+        if clear_legacy:
+            prof.sessionKeysToAttend = []
+        ndb.put_multi([prof] + schedules.values())
+
+    @staticmethod
+    def _backfillWishlists(batch_size=100):
+        """Move wishlists stored as bare session ids onto session keys and
+        place their sessions on Schedules; used by the backfill_wishlists
+        cron job."""
+        q = Profile.query(Profile.sessionKeysToAttend > 0)
+        cursor, more = None, True
+        ids = None
+        while more:
+            profiles, cursor, more = q.fetch_page(batch_size,
+                                                  start_cursor=cursor)
+            if profiles and ids is None:
+                ids = {}
+                for key in Session.query().iter(keys_only=True):
+                    ids.setdefault(key.id(), []).append(key)
+            for prof in profiles:
+                ops = []
+                for s_id in prof.sessionKeysToAttend:
+                    keys = ids.get(s_id, [])
+                    # ids were allocated per organizer; the old lookup
+                    # only ever found the user's own sessions
+                    own = [k for k in keys if k.parent() == prof.key]
+                    keys = own or keys
+                    if len(keys) == 1:
+                        ops.append([uuid.uuid4().hex, 'add',
+                                    keys[0].urlsafe()])
+                    else:
+                        logging.warning('Dropping unresolvable session id '
+                                        '%s from the wishlist of %s',
+                                        s_id, prof.key.id())
+                ConferenceApi._commitWishlistOps(prof.key, ops,
+                                                 clear_legacy=True)
+
+    @staticmethod
+    def _flushWishlist(user_id, retries=5):
+        """Write the user's buffered wishlist ops; used by the
+        flush_wishlist task and before reading the schedules."""
+        client = memcache.Client()
+        key = MEMCACHE_WISHLIST_OPS_KEY % user_id
+        ops = memcache.get(key)
+        if not ops:
+            return
+        ConferenceApi._commitWishlistOps(ndb.Key(Profile, user_id), ops)
+
+        # drop what was written; ops appended meanwhile stay buffered
+        done = set(op[0] for op in ops)
+        for _ in range(retries):
+            current = client.gets(key)
+            if current is None:
+                return
+            if client.cas(key, [op for op in current if op[0] not in done]):
+                return
+
+    @staticmethod
+    def _sessionInterval(session):
+        """Return a session's (start, end) in minutes from midnight."""
+        start = session.start_time.hour * 60 + session.start_time.minute
+        return start, start + session.duration
+
+    @staticmethod
+    def _getSchedule(p_key, session):
+        """Return the user's Schedule for the session's conference, or
+        None if the session can't be placed on one.
+        """
+        if not (session and session.start_time and session.duration):
+            return None
+        key = ndb.Key(Schedule, session.conference_key, parent=p_key)
+        return key.get() or Schedule(key=key)
+
+    @endpoints.method(SessionByConfForm, ScheduleConflictForms,
+                      path='user/wishlist/conflicts',
+                      http_method='POST',
+                      name='getScheduleConflicts')
+    def getScheduleConflicts(self, request):
+        """Return overlapping sessions in a user's wishlist, for one
+        conference or all of them."""
+        prof = self._getProfileFromUser()
+        self._flushWishlist(prof.key.id())
+        if request.conference_key:
+            schedules = [ndb.Key(Schedule, request.conference_key,
+                                 parent=prof.key).get()]
+        else:
+            schedules = Schedule.query(ancestor=prof.key)
+
+        return ScheduleConflictForms(items=[
+            ScheduleConflictForm(
+                conference_key=schedule.key.id(), websafeSessionKey=a,
+                conflictingWebsafeSessionKey=b)
+            for schedule in schedules if schedule
+            for a, b in schedule.conflicts or []])
 
     @endpoints.method(message_types.VoidMessage, SessionForms,
                       path='user/wishlist',
@@ -679,12 +1807,10 @@ class ConferenceApi(remote.Service):
     def get_wishlist(self, request):
         """Get sessions in a user's wishlist"""
 
-        user_id = getUserId(endpoints.get_current_user())
         prof = self._getProfileFromUser()
-        s_keys = [ndb.Key(Session, s_id, parent=ndb.Key(Profile, user_id))
-                  for s_id in prof.sessionKeysToAttend]
-        return SessionForms(
-            items=[self._copySessionToForm(i) for i in ndb.get_multi(s_keys)])
+        s_keys = [ndb.Key(urlsafe=wssk) for wssk in self._wishlistView(prof)]
+        return SessionForms(items=[self._copySessionToForm(s)
+                                   for s in ndb.get_multi(s_keys) if s])
 
     @endpoints.method(WISHLIST_REQUEST, BooleanMessage,
                       path='user/wishlist/add',
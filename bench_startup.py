@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+bench_startup.py -- measure the cold import time of the app's entry points
+
+Each run imports a module in a fresh interpreter, the way a new instance
+does on its first request, and reports the median and worst times. With
+--baseline REV the same runs are made against a checkout of that git
+revision, for before/after numbers.
+
+run with `python bench_startup.py --sdk /path/to/google_appengine`
+
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# the script handlers in app.yaml
+MODULES = ['main', 'api']
+
+_PROBE = """
+import sys, time
+sys.path.insert(0, %(sdk)r)
+import dev_appserver
+dev_appserver.fix_sys_path()
+sys.path.insert(0, %(root)r)
+start = time.time()
+import %(module)s
+sys.stdout.write('%%f' %% (time.time() - start))
+"""
+
+
+def importTime(module, sdk, root=ROOT):
+    """Return the seconds a fresh interpreter takes to import module."""
+    probe = _PROBE % {'sdk': sdk, 'root': root, 'module': module}
+    out = subprocess.check_output([sys.executable, '-c', probe], cwd=root)
+    return float(out.strip().splitlines()[-1])
+
+
+def checkout(rev):
+    """Export the tree at rev into a temporary directory."""
+    root = tempfile.mkdtemp(prefix='bench_startup_')
+    archive = subprocess.Popen(['git', 'archive', rev], cwd=ROOT,
+                               stdout=subprocess.PIPE)
+    subprocess.check_call(['tar', '-x', '-C', root], stdin=archive.stdout)
+    if archive.wait():
+        raise SystemExit('git archive %s failed' % rev)
+    return root
+
+
+def report(label, root, args):
+    for module in MODULES:
+        times = sorted(importTime(module, args.sdk, root)
+                       for _ in range(args.runs))
+        print('%-9s %-6s median %6.1f ms   max %6.1f ms' % (
+            label, module, times[len(times) // 2] * 1000, times[-1] * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sdk', required=True,
+                        help='path to the google_appengine SDK')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--baseline', metavar='REV',
+                        help='also time the tree at this git revision')
+    args = parser.parse_args()
+
+    if args.baseline:
+        root = checkout(args.baseline)
+        try:
+            report(args.baseline[:9], root, args)
+        finally:
+            shutil.rmtree(root)
+    report('current', ROOT, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""
+build.py -- bundle, minify and fingerprint the static assets
+
+Concatenates and minifies the stylesheets and scripts that
+templates/index.html loads, inlines the Angular partials into the
+$templateCache, names each bundle after a hash of its content and writes
+a rewritten index.html next to them under build/. It then writes
+app.build.yaml, a copy of app.yaml whose managed block points at the
+build, with far-future expiration on the fingerprinted files. app.yaml
+itself is never modified.
+
+run with `python build.py`, then deploy app.build.yaml instead of app.yaml
+
+"""
+
+import hashlib
+import json
+import os
+import re
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BUILD_DIR = 'build'
+ASSETS_URL = '/assets'
+
+# (url in index.html, file) in load order
+CSS = [
+    ('/css/bootstrap-cosmo.css', 'static/bootstrap/css/bootstrap-cosmo.css'),
+    ('/css/main.css', 'static/bootstrap/css/main.css'),
+    ('/css/offcanvas.css', 'static/bootstrap/css/offcanvas.css'),
+]
+JS = [
+    ('/js/app.js', 'static/js/app.js'),
+    ('/js/controllers.js', 'static/js/controllers.js'),
+]
+PARTIALS_DIR = 'static/partials'
+PARTIALS_URL = '/partials'
+ANGULAR_MODULE = 'conferenceApp'
+
+INDEX = 'templates/index.html'
+APP_YAML = 'app.yaml'
+DEPLOY_YAML = 'app.build.yaml'
+BEGIN_MARKER = '# BEGIN BUILD'
+END_MARKER = '# END BUILD'
+
+BUILT_HANDLERS = """\
+- url: %(assets_url)s
+  static_dir: %(build_dir)s/assets
+  expiration: "365d"
+
+- url: /
+  static_files: %(build_dir)s/index.html
+  upload: %(build_dir)s/index\\.html
+  expiration: "0s"
+  secure: always
+"""
+
+
+def _read(path):
+    with open(os.path.join(ROOT, path)) as f:
+        return f.read()
+
+
+def _write(path, data):
+    path = os.path.join(ROOT, path)
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(data)
+
+
+def _stripComments(src, line_comments=True):
+    """Remove /* */ (and optionally //) comments outside string literals."""
+    out = []
+    i, n = 0, len(src)
+    while i < n:
+        c = src[i]
+        if c in '"\'':
+            j = i + 1
+            while j < n and src[j] != c:
+                j += 2 if src[j] == '\\' else 1
+            out.append(src[i:j + 1])
+            i = j + 1
+        elif src.startswith('/*', i):
+            j = src.find('*/', i + 2)
+            i = n if j < 0 else j + 2
+        elif line_comments and src.startswith('//', i) and (
+                i == 0 or src[i - 1] in ' \t\n;{}(,'):
+            j = src.find('\n', i)
+            i = n if j < 0 else j
+        else:
+            out.append(c)
+            i += 1
+    return ''.join(out)
+
+
+def minifyCss(src):
+    src = _stripComments(src, line_comments=False)
+    src = re.sub(r'\s+', ' ', src)
+    src = re.sub(r'\s*([{};,>])\s*', r'\1', src)
+    return src.replace(';}', '}').strip() + '\n'
+
+
+def minifyJs(src):
+    """Drop comments and indentation, keeping line breaks so automatic
+    semicolon insertion still sees the same statements.
+    """
+    src = _stripComments(src)
+    lines = (line.strip() for line in src.splitlines())
+    return '\n'.join(line for line in lines if line) + '\n'
+
+
+def templateCacheJs():
+    """Return a run block putting every partial in the $templateCache."""
+    puts = []
+    for name in sorted(os.listdir(os.path.join(ROOT, PARTIALS_DIR))):
+        if name.endswith('.html'):
+            html = _read(os.path.join(PARTIALS_DIR, name))
+            puts.append('$templateCache.put(%s, %s);' % (
+                json.dumps('%s/%s' % (PARTIALS_URL, name)), json.dumps(html)))
+    return ("angular.module('%s').run(['$templateCache', "
+            "function ($templateCache) {\n%s\n}]);\n"
+            % (ANGULAR_MODULE, '\n'.join(puts)))
+
+
+def _fingerprint(name, ext, data):
+    digest = hashlib.sha1(data.encode('utf-8') if not isinstance(
+        data, bytes) else data).hexdigest()[:12]
+    filename = '%s.%s.%s' % (name, digest, ext)
+    _write(os.path.join(BUILD_DIR, 'assets', filename), data)
+    return '%s/%s' % (ASSETS_URL, filename)
+
+
+def rewriteIndex(css_url, js_url):
+    """Swap the individual stylesheets and scripts for the bundles."""
+    html = _read(INDEX)
+    for i, (url, _) in enumerate(CSS):
+        tag = re.compile(r'[ \t]*<link rel="stylesheet" href="%s">\n?'
+                         % re.escape(url))
+        html = tag.sub('    <link rel="stylesheet" href="%s">\n' % css_url
+                       if i == 0 else '', html)
+    for i, (url, _) in enumerate(JS):
+        tag = re.compile(r'<script src="%s"></script>\n?' % re.escape(url))
+        html = tag.sub('<script src="%s"></script>\n' % js_url
+                       if i == 0 else '', html)
+    _write(os.path.join(BUILD_DIR, 'index.html'), html)
+
+
+def writeDeployYaml(handlers):
+    """Write DEPLOY_YAML: app.yaml with its managed block replaced by
+    handlers."""
+    yaml = _read(APP_YAML)
+    start = yaml.index('\n', yaml.index(BEGIN_MARKER)) + 1
+    end = yaml.index(END_MARKER)
+    _write(DEPLOY_YAML, '# Generated by build.py from %s; do not edit.\n'
+           % APP_YAML + yaml[:start] + handlers + yaml[end:])
+
+
+def build():
+    css = ''.join(minifyCss(_read(path)) for _, path in CSS)
+    js = ''.join(minifyJs(_read(path)) for _, path in JS)
+    js += minifyJs(templateCacheJs())
+    css_url = _fingerprint('app', 'css', css)
+    js_url = _fingerprint('app', 'js', js)
+    rewriteIndex(css_url, js_url)
+    writeDeployYaml(BUILT_HANDLERS % {'assets_url': ASSETS_URL,
+                                     'build_dir': BUILD_DIR})
+    return css_url, js_url
+
+
+if __name__ == '__main__':
+    for url in build():
+        print(url)
+    print(DEPLOY_YAML)
@@ -1,10 +1,14 @@
 import httplib
 import endpoints
-from protorpc import messages
-from google.appengine.ext import ndb
 
 
 class ConflictException(endpoints.ServiceException):
 
     """ConflictException -- exception mapped to HTTP 409 response"""
     http_status = httplib.CONFLICT
+
+
+class OverloadedException(endpoints.ServiceException):
+
+    """OverloadedException -- exception mapped to HTTP 503 response"""
+    http_status = httplib.SERVICE_UNAVAILABLE
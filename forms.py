@@ -1,7 +1,4 @@
-import httplib
-import endpoints
 from protorpc import messages
-from google.appengine.ext import ndb
 
 
 class StringMessage(messages.Message):
@@ -10,6 +7,16 @@ class StringMessage(messages.Message):
     data = messages.StringField(1, required=True)
 
 
+class VersionedStringMessage(messages.Message):
+
+    """VersionedStringMessage-- outbound string message with a version
+    token; notModified is set (and data left out) when the client's
+    token is still current"""
+    data = messages.StringField(1)
+    etag = messages.StringField(2)
+    notModified = messages.BooleanField(3)
+
+
 class BooleanMessage(messages.Message):
 
     """BooleanMessage-- outbound Boolean value message"""
@@ -45,6 +52,12 @@ class ConferenceForm(messages.Message):
     endDate = messages.StringField(10)  # DateTimeField()
     websafeKey = messages.StringField(11)
     organizerDisplayName = messages.StringField(12)
+    etag = messages.StringField(13)
+    notModified = messages.BooleanField(14)
+    attending = messages.BooleanField(15)
+    latitude = messages.FloatField(16)
+    longitude = messages.FloatField(17)
+    distanceKm = messages.FloatField(18)
 
 
 class ConferenceForms(messages.Message):
@@ -53,6 +66,12 @@ class ConferenceForms(messages.Message):
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
 
 
+class WebsafeKeysForm(messages.Message):
+
+    """WebsafeKeysForm -- inbound list of websafe entity keys"""
+    websafeKeys = messages.StringField(1, repeated=True)
+
+
 class ConferenceQueryForm(messages.Message):
 
     """ConferenceQueryForm -- Conference query inbound form message"""
@@ -80,14 +99,18 @@ class SessionForm(messages.Message):
     start_time = messages.StringField(8)
     duration = messages.IntegerField(9)
     location = messages.StringField(10)
+    websafeKey = messages.StringField(11)
 
 
 class SessionForms(messages.Message):
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    etag = messages.StringField(2)
+    notModified = messages.BooleanField(3)
 
 
 class SessionByConfForm(messages.Message):
     conference_key = messages.StringField(1)
+    ifNoneMatch = messages.StringField(2)
 
 
 class SessionByLocationForm(messages.Message):
@@ -111,7 +134,131 @@ class SessionQueryForms(messages.Message):
 
 class SpeakerForm(messages.Message):
     name = messages.StringField(1)
+    speaker_id = messages.IntegerField(2)
 
 
 class SpeakerForms(messages.Message):
     items = messages.MessageField(SpeakerForm, 1, repeated=True)
+
+
+class GroupRegistrationForm(messages.Message):
+    userIds = messages.StringField(1, repeated=True)
+
+
+class RegistrationResultForm(messages.Message):
+    userId = messages.StringField(1)
+    registered = messages.BooleanField(2)
+    message = messages.StringField(3)
+
+
+class RegistrationResultForms(messages.Message):
+    items = messages.MessageField(RegistrationResultForm, 1, repeated=True)
+
+
+class FacetBucketForm(messages.Message):
+    value = messages.StringField(1)
+    count = messages.IntegerField(2)
+    seatsAvailable = messages.IntegerField(3)
+
+
+class FacetForm(messages.Message):
+    field = messages.StringField(1)
+    buckets = messages.MessageField(FacetBucketForm, 2, repeated=True)
+
+
+class FacetForms(messages.Message):
+    items = messages.MessageField(FacetForm, 1, repeated=True)
+
+
+class ScheduleConflictForm(messages.Message):
+    conference_key = messages.StringField(1)
+    websafeSessionKey = messages.StringField(2)
+    conflictingWebsafeSessionKey = messages.StringField(3)
+
+
+class ScheduleConflictForms(messages.Message):
+    items = messages.MessageField(ScheduleConflictForm, 1, repeated=True)
+
+
+class SyncRequestForm(messages.Message):
+
+    """SyncRequestForm -- inbound syncChanges request; leave syncToken
+    empty for a full sync"""
+    syncToken = messages.StringField(1)
+    pageSize = messages.IntegerField(2)
+
+
+class TombstoneForm(messages.Message):
+
+    """TombstoneForm -- a deleted entity"""
+    kind = messages.StringField(1)
+    websafeKey = messages.StringField(2)
+
+
+class SyncForm(messages.Message):
+
+    """SyncForm -- one page of changes; call again with syncToken while
+    more is set. reset means the client must drop what it holds first"""
+    conferences = messages.MessageField(ConferenceForm, 1, repeated=True)
+    sessions = messages.MessageField(SessionForm, 2, repeated=True)
+    speakers = messages.MessageField(SpeakerForm, 3, repeated=True)
+    deleted = messages.MessageField(TombstoneForm, 4, repeated=True)
+    syncToken = messages.StringField(5)
+    more = messages.BooleanField(6)
+    reset = messages.BooleanField(7)
+
+
+class AdmissionMetricForm(messages.Message):
+
+    """AdmissionMetricForm -- registration admission counts for one
+    minute"""
+    minute = messages.StringField(1)
+    admitted = messages.IntegerField(2)
+    queued = messages.IntegerField(3)
+    shedRate = messages.IntegerField(4)
+    shedInflight = messages.IntegerField(5)
+
+
+class AdmissionMetricForms(messages.Message):
+    items = messages.MessageField(AdmissionMetricForm, 1, repeated=True)
+
+
+class ConferenceNearForm(messages.Message):
+
+    """ConferenceNearForm -- searchConferencesNear request; give a city
+    or latitude and longitude"""
+    city = messages.StringField(1)
+    latitude = messages.FloatField(2)
+    longitude = messages.FloatField(3)
+    radiusKm = messages.FloatField(4)
+    pageSize = messages.IntegerField(5)
+    pageToken = messages.StringField(6)
+
+
+class ConferenceNearForms(messages.Message):
+
+    """ConferenceNearForms -- one page of conferences, nearest first"""
+    items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+
+class TopicStatsForm(messages.Message):
+    topic = messages.StringField(1)
+    conferences = messages.IntegerField(2)
+    registered = messages.IntegerField(3)
+    fillRate = messages.FloatField(4)
+    rank = messages.IntegerField(5)
+
+
+class ConferenceStatsForm(messages.Message):
+
+    """ConferenceStatsForm -- analytics report for one conference, as of
+    generated"""
+    websafeKey = messages.StringField(1)
+    registered = messages.IntegerField(2)
+    capacity = messages.IntegerField(3)
+    fillRate = messages.FloatField(4)
+    fillRatePercentile = messages.FloatField(5)
+    registrationsPerHour = messages.FloatField(6)
+    topics = messages.MessageField(TopicStatsForm, 7, repeated=True)
+    generated = messages.StringField(8)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""geo.py
+
+City lookup and geohash cells for the conference proximity search.
+
+Conference.city is free text. locate() resolves it against the bundled
+gazetteer (gazetteer.csv), so no geocoding service is called. A located
+conference stores the geohash of its point at every precision from
+MIN_PRECISION to MAX_PRECISION. A radius query then only has to match
+the few cells that cover the circle (coveringCells) and check the exact
+distance of what comes back.
+
+"""
+
+import codecs
+import math
+import os
+
+GAZETTEER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'gazetteer.csv')
+
+MIN_PRECISION = 1
+MAX_PRECISION = 6           # cells of about 1.2 x 0.6 km
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+# normalized name -> (latitude, longitude); loaded on first use
+_places = None
+
+
+def _normalize(name):
+    return u' '.join(name.lower().split())
+
+
+def _load():
+    places = {}
+    with codecs.open(GAZETTEER, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            name, country, lat, lng, aliases = line.rstrip('\n').split(',')
+            point = (float(lat), float(lng))
+            names = [name] + [a for a in aliases.split('|') if a]
+            for n in names:
+                places.setdefault(_normalize(n), point)
+                places.setdefault(_normalize(u'%s, %s' % (n, country)), point)
+    return places
+
+
+def locate(city):
+    """Return (latitude, longitude) for a city name, or None if the
+    gazetteer doesn't know it. "Paris, FR" and "Portland, Oregon" style
+    names are tried whole, then by their first part."""
+    global _places
+    if not city:
+        return None
+    if _places is None:
+        _places = _load()
+    if isinstance(city, str):
+        city = city.decode('utf-8', 'replace')
+    name = _normalize(city)
+    return _places.get(name) or _places.get(name.split(',')[0].strip())
+
+
+def _cellSize(precision):
+    """Return (height, width) in degrees of a cell at precision."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def encode(lat, lng, precision=MAX_PRECISION):
+    """Return the geohash of a point."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, value, bit, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(_BASE32[value])
+            value, bit = 0, 0
+    return ''.join(chars)
+
+
+def prefixes(lat, lng):
+    """Return the point's geohash at every stored precision."""
+    full = encode(lat, lng, MAX_PRECISION)
+    return [full[:p] for p in range(MIN_PRECISION, MAX_PRECISION + 1)]
+
+
+def coveringCells(lat, lng, radius_km, max_cells):
+    """Return the geohashes of the finest precision at which at most
+    max_cells cells cover the circle's bounding box."""
+    dlat = radius_km / KM_PER_DEGREE
+    south, north = max(-90.0, lat - dlat), min(90.0, lat + dlat)
+    cos_lat = min(math.cos(math.radians(south)),
+                  math.cos(math.radians(north)))
+    if cos_lat <= 0 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+        west, east = -180.0, 180.0
+    else:
+        dlng = radius_km / (KM_PER_DEGREE * cos_lat)
+        west, east = lng - dlng, lng + dlng
+
+    for precision in range(MAX_PRECISION, MIN_PRECISION - 1, -1):
+        height, width = _cellSize(precision)
+        columns = int(round(360.0 / width))
+        rows = range(int((south + 90) // height),
+                     min(int((north + 90) // height), int(180 / height) - 1)
+                     + 1)
+        cols = range(int(math.floor((west + 180) / width)),
+                     int(math.floor((east + 180) / width)) + 1)
+        if len(cols) > columns:
+            cols = range(columns)
+        if len(rows) * len(cols) > max_cells and precision > MIN_PRECISION:
+            continue
+        # encode each cell's centre; columns wrap at the antimeridian
+        return sorted(set(
+            encode(-90 + (r + 0.5) * height,
+                   -180 + (c % columns + 0.5) * width, precision)
+            for r in rows for c in cols))
+
+
+def distanceKm(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2)
+         * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
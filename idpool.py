@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+"""idpool.py
+
+Per-instance pools of datastore ids reserved ahead of use.
+
+Creating a Conference or Session used to start with a blocking
+allocate_ids(size=1) RPC. An IdPool reserves ids in batches and hands them
+out from memory. When it runs low it starts the next allocate_ids_async
+without waiting; callers decorated with ndb.toplevel let that RPC finish
+alongside their own puts before the request returns.
+
+Ids are only unique among entities with the same parent, so an entity
+created under a parent must take its id from that parent's pool.
+IdPools keeps one small pool per parent for the most recently used
+parents.
+
+"""
+
+import collections
+import logging
+import threading
+
+
+class IdPool(object):
+
+    """IdPool -- ids for one kind (and parent) reserved in batches"""
+
+    def __init__(self, model, parent=None, batch_size=100, low_water=20):
+        self.model = model
+        self.parent = parent
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self._ids = collections.deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def next(self):
+        """Return a reserved id, refilling the pool as needed."""
+        with self._lock:
+            if not self._ids:
+                # cold pool: one synchronous batch instead of one per id
+                self._extend(self.model.allocate_ids(
+                    size=self.batch_size, parent=self.parent))
+            id_ = self._ids.popleft()
+            refill = len(self._ids) < self.low_water and not self._refilling
+            if refill:
+                self._refilling = True
+        if refill:
+            future = self.model.allocate_ids_async(
+                size=self.batch_size, parent=self.parent)
+            future.add_callback(self._refilled, future)
+        return id_
+
+    def _extend(self, id_range):
+        first, last = id_range
+        self._ids.extend(range(first, last + 1))
+
+    def _refilled(self, future):
+        with self._lock:
+            self._refilling = False
+            try:
+                self._extend(future.get_result())
+            except Exception:
+                logging.exception('Refilling %s ids failed',
+                                  self.model._get_kind())
+
+
+class IdPools(object):
+
+    """IdPools -- one IdPool per parent for a kind, for the most recently
+    used max_parents parents"""
+
+    def __init__(self, model, max_parents=1000, batch_size=10, low_water=3):
+        self.model = model
+        self.max_parents = max_parents
+        self.batch_size = batch_size
+        self.low_water = low_water
+        self._pools = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def next(self, parent):
+        """Return a reserved id for a new entity under parent."""
+        with self._lock:
+            pool = self._pools.pop(parent, None)
+            if pool is None:
+                pool = IdPool(self.model, parent, self.batch_size,
+                              self.low_water)
+            self._pools[parent] = pool
+            if len(self._pools) > self.max_parents:
+                # reserved ids left in the evicted pool are just unused
+                self._pools.popitem(last=False)
+        return pool.next()
@@ -14,8 +14,25 @@ __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 import webapp2
 from google.appengine.api import app_identity
-from google.appengine.api import mail
+from google.appengine.api import memcache
 from api import ConferenceApi
+from models import Catalog
+from utils import MEMCACHE_ANNOUNCEMENTS_KEY
+from utils import MEMCACHE_WISHLIST_FLUSH_KEY
+
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Load the modules and fill the caches the first requests on a
+        new instance would otherwise pay for."""
+        # importing api (above) built the endpoints server; taskqueue is
+        # imported lazily but needed by the write paths
+        from google.appengine.api import taskqueue
+        ConferenceApi._getFacetCounts()
+        ConferenceApi._getCatalogPage(0)
+        if memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) is None:
+            ConferenceApi._cacheAnnouncement()
+        self.response.set_status(200)
+
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
@@ -30,9 +47,101 @@ class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
         self.response.set_status(204)
 
 
+class PropagateSpeakerNameHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy a renamed Speaker's name onto their sessions."""
+        ConferenceApi._propagateSpeakerName(self.request.get('speaker_id'))
+        self.response.set_status(204)
+
+
+class FlushWishlistHandler(webapp2.RequestHandler):
+    def post(self):
+        """Write a user's buffered wishlist changes."""
+        user_id = self.request.get('user_id')
+        # ops buffered from now on schedule their own flush
+        memcache.delete(MEMCACHE_WISHLIST_FLUSH_KEY % user_id)
+        ConferenceApi._flushWishlist(user_id)
+        self.response.set_status(204)
+
+
+class ApplyFacetDeltasHandler(webapp2.RequestHandler):
+    def get(self):
+        """Apply the queued conference facet deltas."""
+        ConferenceApi._applyFacetDeltas()
+        self.response.set_status(204)
+
+
+class RebuildFacetsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Recount conference facets from scratch."""
+        ConferenceApi._rebuildFacets()
+        self.response.set_status(204)
+
+
+class BuildCatalogHandler(webapp2.RequestHandler):
+    def post(self):
+        """Regenerate the public catalog snapshot."""
+        ConferenceApi._buildCatalog()
+        self.response.set_status(204)
+
+
+class CatalogHandler(webapp2.RequestHandler):
+    def get(self):
+        """Serve a page of the public catalog snapshot."""
+        try:
+            page = int(self.request.get('page', 0))
+        except ValueError:
+            self.abort(400)
+        result = ConferenceApi._getCatalogPage(page)
+        if result is None:
+            Catalog.scheduleRebuild()
+            self.abort(503, headers={
+                'Retry-After': str(Catalog.DEBOUNCE_SECONDS)})
+        etag, page_count, body = result
+        if body is None:
+            self.abort(404)
+
+        self.response.headers['Cache-Control'] = 'public, max-age=60'
+        self.response.etag = '%s-%d' % (etag, page)
+        if self.response.etag in self.request.if_none_match:
+            self.response.set_status(304)
+            return
+        self.response.content_type = 'application/json'
+        self.response.write(body)
+
+
+class BackfillConferencesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Fill in derived Conference fields missing on old entities."""
+        ConferenceApi._backfillConferences()
+        self.response.set_status(204)
+
+
+class BackfillWishlistsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Move legacy wishlists onto session keys and Schedules."""
+        ConferenceApi._backfillWishlists()
+        self.response.set_status(204)
+
+
+class BuildStatsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Recompute the conference analytics reports."""
+        ConferenceApi._buildConferenceStats()
+        self.response.set_status(204)
+
+
+class PurgeTombstonesHandler(webapp2.RequestHandler):
+    def get(self):
+        """Delete sync tombstones past their retention."""
+        ConferenceApi._purgeTombstones()
+        self.response.set_status(204)
+
+
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
         """Send email confirming Conference creation."""
+        from google.appengine.api import mail
         mail.send_mail(
             'noreply@%s.appspotmail.com' % (
                 app_identity.get_application_id()),     # from
@@ -44,7 +153,18 @@ class SendConfirmationEmailHandler(webapp2.RequestHandler):
         )
 
 app = webapp2.WSGIApplication([
+    ('/_ah/warmup', WarmupHandler),
     ('/crons/set_announcement', SetAnnouncementHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler),
+    ('/tasks/propagate_speaker_name', PropagateSpeakerNameHandler),
+    ('/tasks/flush_wishlist', FlushWishlistHandler),
+    ('/crons/rebuild_facets', RebuildFacetsHandler),
+    ('/crons/apply_facet_deltas', ApplyFacetDeltasHandler),
+    ('/crons/purge_tombstones', PurgeTombstonesHandler),
+    ('/crons/backfill_conferences', BackfillConferencesHandler),
+    ('/crons/backfill_wishlists', BackfillWishlistsHandler),
+    ('/crons/build_stats', BuildStatsHandler),
+    ('/tasks/build_catalog', BuildCatalogHandler),
+    ('/catalog', CatalogHandler),
 ], debug=True)
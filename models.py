@@ -12,11 +12,15 @@ created/forked from conferences.py by wesc on 2014 may 24
 
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
-import httplib
-import endpoints
-from protorpc import messages
+from bisect import bisect_left
+from bisect import insort
+from datetime import timedelta
+import time
+from google.appengine.api import memcache
 from google.appengine.ext import ndb
 
+import geo
+
 
 class Profile(ndb.Model):
 
@@ -24,10 +28,32 @@ class Profile(ndb.Model):
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
+    # legacy bare session ids, moved to sessionsToAttend by the
+    # backfill_wishlists cron job
     sessionKeysToAttend = ndb.IntegerProperty(repeated=True)
+    sessionsToAttend = ndb.KeyProperty(kind='Session', repeated=True)
+
+
+class Tombstone(ndb.Model):
+
+    """Tombstone -- records a deleted SyncedModel entity for syncChanges"""
+    kind = ndb.StringProperty()
+    websafeKey = ndb.StringProperty()
+    deleted = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class SyncedModel(ndb.Model):
+
+    """SyncedModel -- base for kinds served by syncChanges: stamps every
+    write and leaves a Tombstone for every delete"""
+    updated = ndb.DateTimeProperty(auto_now=True)
 
+    @classmethod
+    def _post_delete_hook(cls, key, future):
+        Tombstone(kind=key.kind(), websafeKey=key.urlsafe()).put()
 
-class Conference(ndb.Model):
+
+class Conference(SyncedModel):
 
     """Conference -- Conference object"""
     name = ndb.StringProperty(required=True)
@@ -40,10 +66,89 @@ class Conference(ndb.Model):
     endDate = ndb.DateProperty()
     maxAttendees = ndb.IntegerProperty()
     seatsAvailable = ndb.IntegerProperty()
+    dateBuckets = ndb.StringProperty(repeated=True)
+    location = ndb.GeoPtProperty(indexed=False)
+    geohashes = ndb.StringProperty(repeated=True)
+    version = ndb.IntegerProperty(default=0)
+
+    VERSION_CACHE_KEY = "CONFERENCE VERSION %s"
+
+    # ranges up to this many days are matched on week buckets,
+    # longer ones on month buckets
+    WEEK_BUCKET_MAX_DAYS = 62
+    MAX_DATE_BUCKETS = 30
+
+    @staticmethod
+    def weekBucket(d):
+        return 'w%04d-%02d' % d.isocalendar()[:2]
+
+    @staticmethod
+    def monthBucket(d):
+        return 'm%04d-%02d' % (d.year, d.month)
+
+    @classmethod
+    def dateBucketsForRange(cls, start, end):
+        """Return the buckets covering start..end (inclusive), or None
+        if the range needs more than MAX_DATE_BUCKETS of them.
+        """
+        buckets = []
+        if (end - start).days <= cls.WEEK_BUCKET_MAX_DAYS:
+            d = start - timedelta(days=start.weekday())
+            while d <= end:
+                buckets.append(cls.weekBucket(d))
+                d += timedelta(days=7)
+        else:
+            year, month = start.year, start.month
+            while (year, month) <= (end.year, end.month):
+                buckets.append('m%04d-%02d' % (year, month))
+                year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        if len(buckets) > cls.MAX_DATE_BUCKETS:
+            return None
+        return buckets
+
+    def _pre_put_hook(self):
+        """Keep dateBuckets in step with startDate and the location with
+        city, bump the version."""
+        self.bucketDates()
+        self.locate()
+        self.version = (self.version or 0) + 1
+
+    def bucketDates(self):
+        """Set dateBuckets from startDate; return True if they changed."""
+        buckets = []
+        if self.startDate:
+            buckets = [self.weekBucket(self.startDate),
+                       self.monthBucket(self.startDate)]
+        if buckets == self.dateBuckets:
+            return False
+        self.dateBuckets = buckets
+        return True
+
+    def locate(self):
+        """Set location and geohashes from city; return True if they
+        changed."""
+        point = geo.locate(self.city)
+        location = ndb.GeoPt(*point) if point else None
+        if location == self.location:
+            return False
+        self.location = location
+        self.geohashes = geo.prefixes(*point) if point else []
+        return True
+
+    def _post_put_hook(self, future):
+        """Once committed, publish the new version to memcache and
+        schedule a rebuild of the catalog snapshot."""
+        key = self.VERSION_CACHE_KEY % self.key.urlsafe()
+        version = str(self.version)
+
+        def committed():
+            memcache.set(key, version)
+            Catalog.scheduleRebuild()
+        ndb.get_context().call_on_commit(committed)
 
 # ---------------- begin added models --------------------------------
 
-class Session(ndb.Model):
+class Session(SyncedModel):
     conference_key = ndb.StringProperty(required=True)
     title = ndb.StringProperty(required=True)
     session_type = ndb.StringProperty(required=True)
@@ -54,9 +159,143 @@ class Session(ndb.Model):
     start_time = ndb.TimeProperty()
     duration = ndb.IntegerProperty()
     location = ndb.StringProperty(default='')
+    version = ndb.IntegerProperty(default=0)
+
+    LIST_VERSION_CACHE_KEY = "SESSIONS VERSION %s"
+
+    def _pre_put_hook(self):
+        self.version = (self.version or 0) + 1
 
+    def _post_put_hook(self, future):
+        """Expire the conference's session list token once committed."""
+        key = self.LIST_VERSION_CACHE_KEY % self.conference_key
+        ndb.get_context().call_on_commit(lambda: memcache.delete(key))
 
-class Speaker(ndb.Model):
+
+class Speaker(SyncedModel):
     name = ndb.StringProperty(required=True)
+    organizerUserId = ndb.StringProperty()
+
+
+class SpeakerRoster(ndb.Model):
+
+    """SpeakerRoster -- speaker id -> websafe keys of their sessions in
+    one conference; keyed by conference_key"""
+    speakers = ndb.JsonProperty()
+
+
+class Agenda(ndb.Model):
+
+    """Agenda -- every session of one conference as SessionForm fields,
+    sorted by start_time; keyed by conference_key"""
+    sessions = ndb.JsonProperty(compressed=True)
+
+    def _post_put_hook(self, future):
+        """Expire the session list token, which now lags the agenda."""
+        key = Session.LIST_VERSION_CACHE_KEY % self.key.id()
+        ndb.get_context().call_on_commit(lambda: memcache.delete(key))
+
+
+class Schedule(ndb.Model):
+
+    """Schedule -- a user's wishlisted sessions for one conference.
+
+    Child of the user's Profile, keyed by conference_key. intervals holds
+    [start, end, websafe session key] with start and end in minutes from
+    midnight, sorted by start, so overlaps with a new session are found
+    by bisecting to the window of starts between (start - maxDuration)
+    and end. Session ids are only unique per organizer, so sessions are
+    always identified by their full key.
+    """
+    intervals = ndb.JsonProperty()
+    maxDuration = ndb.IntegerProperty(default=0)
+    conflicts = ndb.JsonProperty()
+
+    def overlapping(self, start, end):
+        """Return the intervals overlapping [start, end)."""
+        intervals = self.intervals or []
+        lo = bisect_left(intervals, [start - self.maxDuration])
+        hi = bisect_left(intervals, [end])
+        return [i for i in intervals[lo:hi] if i[1] > start]
+
+    def add(self, wssk, start, end):
+        """Add a session by websafe key, returning the keys of the
+        sessions it overlaps."""
+        clashes = [i[2] for i in self.overlapping(start, end)
+                   if i[2] != wssk]
+        intervals = self.intervals or []
+        insort(intervals, [start, end, wssk])
+        self.intervals = intervals
+        self.maxDuration = max(self.maxDuration, end - start)
+        self.conflicts = (self.conflicts or []) + [
+            sorted([wssk, other]) for other in clashes]
+        return clashes
+
+    def remove(self, wssk):
+        """Drop a session and any conflicts it was part of."""
+        self.intervals = [i for i in self.intervals or []
+                          if i[2] != wssk]
+        self.conflicts = [c for c in self.conflicts or []
+                          if wssk not in c]
+
+
+class Catalog(ndb.Model):
+
+    """Catalog -- the current snapshot of the public conference catalog;
+    its pages are CatalogPage children named '<etag>-<page>'"""
+    etag = ndb.StringProperty()
+    pageCount = ndb.IntegerProperty(default=0)
+    generated = ndb.DateTimeProperty(auto_now=True)
+
+    ID = 'public'
+    DEBOUNCE_SECONDS = 30
+
+    @classmethod
+    def scheduleRebuild(cls):
+        """Queue one rebuild per DEBOUNCE_SECONDS window, however many
+        conference writes land in it."""
+        window = int(time.time()) // cls.DEBOUNCE_SECONDS
+        if not memcache.add('CATALOG DIRTY %d' % window, 1,
+                            time=cls.DEBOUNCE_SECONDS * 2):
+            return
+        from google.appengine.api import taskqueue
+        try:
+            taskqueue.add(url='/tasks/build_catalog',
+                          name='build-catalog-%d' % window,
+                          countdown=cls.DEBOUNCE_SECONDS)
+        except (taskqueue.TaskAlreadyExistsError,
+                taskqueue.TombstonedTaskError):
+            pass
+
+
+class CatalogPage(ndb.Model):
+
+    """CatalogPage -- one gzipped JSON page of the catalog snapshot"""
+    data = ndb.BlobProperty()
+
+
+class ConferenceFacets(ndb.Model):
+    """ConferenceFacets -- conference and seat counts per filter bucket"""
+    counts = ndb.JsonProperty()
+
+
+class ConferenceStats(ndb.Model):
+
+    """ConferenceStats -- analytics report for one conference; keyed by
+    the conference's websafe key"""
+    registered = ndb.IntegerProperty(indexed=False)
+    capacity = ndb.IntegerProperty(indexed=False)
+    fillRate = ndb.FloatProperty(indexed=False)
+    fillRatePercentile = ndb.FloatProperty(indexed=False)
+    registrationsPerHour = ndb.FloatProperty(indexed=False)
+    generated = ndb.DateTimeProperty(indexed=False)
+
+
+class TopicStats(ndb.Model):
 
+    """TopicStats -- topic -> popularity figures from the last analytics
+    run"""
+    topics = ndb.JsonProperty(compressed=True)
+    generated = ndb.DateTimeProperty(indexed=False)
 
+    ID = 'all'
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+
+"""planner.py
+
+Query planner for the Conference and Session filter queries.
+
+INDEXES lists every composite index the app declares. plan() picks a
+datastore query that one of them (or a built-in single-property index)
+can serve. When none fits it falls back to an equality-only query, which
+the datastore answers with a zigzag merge join over the built-in
+indexes, and does the rest of the filtering and sorting in memory.
+
+Run this module to print the matching index.yaml:
+
+    python planner.py > index.yaml
+
+"""
+
+import logging
+import operator
+
+
+# kind -> composite indexes, equality properties first, then the
+# inequality property (if any) and the sort order
+INDEXES = {
+    'Conference': [
+        ('city', 'name'),
+        ('topics', 'name'),
+        ('month', 'name'),
+        ('maxAttendees', 'name'),
+        ('dateBuckets', 'name'),
+        ('dateBuckets', 'maxAttendees', 'name'),
+        # projection query behind the announcement cron
+        ('seatsAvailable', 'name'),
+    ],
+    'Session': [
+        ('duration', 'title'),
+        ('location', 'title'),
+        ('session_type', 'title'),
+        ('speaker_name', 'title'),
+        ('start_time', 'title'),
+    ],
+}
+
+EQUALITY_OPERATORS = ('=', 'IN')
+
+_QUERY_OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'IN': lambda prop, value: prop.IN(value),
+}
+
+_MEMORY_OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'IN': lambda a, b: a in b,
+}
+
+# index combinations already reported as missing by this instance
+_reported = set()
+
+
+class QueryPlan(object):
+
+    """QueryPlan -- a datastore query plus the work left to do in memory"""
+
+    def __init__(self, query, index=None, memory_filters=(), sort=None):
+        self.query = query
+        self.index = index
+        self.memory_filters = list(memory_filters)
+        self.sort = sort
+
+    def run(self):
+        """Run the query and return the filtered, ordered entities."""
+        results = [e for e in self.query
+                   if all(_matches(e, f) for f in self.memory_filters)]
+        if self.sort:
+            results.sort(key=lambda e: tuple(
+                _sortValue(getattr(e, field, None)) for field in self.sort))
+        return results
+
+
+def _sortValue(value):
+    if isinstance(value, list):
+        return min(value) if value else None
+    return value
+
+
+def _matches(entity, filtr):
+    """In-memory check of one filter; repeated properties match if any
+    of their values does, as in the datastore.
+    """
+    values = getattr(entity, filtr['field'], None)
+    if not isinstance(values, list):
+        values = [values]
+    test = _MEMORY_OPERATORS[filtr['operator']]
+    return any(v is not None and test(v, filtr['value']) for v in values)
+
+
+def _filterNode(model, filtr):
+    prop = model._properties.get(filtr['field'])
+    if prop is None:
+        raise ValueError('%s has no property %s' % (
+            model._get_kind(), filtr['field']))
+    return _QUERY_OPERATORS[filtr['operator']](prop, filtr['value'])
+
+
+def _coveringIndex(kind, eq_fields, tail):
+    """Return the declared index serving eq_fields + tail, if any."""
+    n = len(eq_fields)
+    for index in INDEXES.get(kind, ()):
+        if set(index[:n]) == set(eq_fields) and list(index[n:]) == tail:
+            return index
+    return None
+
+
+def _reportMissing(kind, fields):
+    if (kind, fields) in _reported:
+        return
+    _reported.add((kind, fields))
+    logging.warning('No declared index for %s query on %s; serving it '
+                    'from a merge join. Add to INDEXES if it is common:\n%s',
+                    kind, ', '.join(fields), _indexYaml(kind, fields))
+
+
+def plan(model, filters, order, memory_filters=()):
+    """Plan a query on model.
+
+    filters are dicts with 'field', 'operator' and 'value' keys and at
+    most one inequality field; order is the property results are sorted
+    by after the inequality field. memory_filters are always applied in
+    memory.
+    """
+    kind = model._get_kind()
+    eq = [f for f in filters if f['operator'] in EQUALITY_OPERATORS]
+    ineq = [f for f in filters if f['operator'] not in EQUALITY_OPERATORS]
+    eq_fields = sorted(set(f['field'] for f in eq))
+    ineq_field = ineq[0]['field'] if ineq else None
+
+    sort = [ineq_field] if ineq_field else []
+    if order not in sort:
+        sort.append(order)
+    # the datastore ignores a sort on an equality-filtered property, so
+    # it takes no place in the index
+    tail = [field for field in sort if field not in eq_fields]
+
+    # one sorted property, or equality filters alone (a merge join)
+    builtin = len(tail) <= 1 if not eq_fields else not tail
+    index = None if builtin else _coveringIndex(kind, eq_fields, tail)
+    if builtin or index:
+        q = model.query(*[_filterNode(model, f) for f in filters])
+        for field in sort:
+            q = q.order(model._properties[field])
+        return QueryPlan(q, index, memory_filters)
+
+    _reportMissing(kind, tuple(eq_fields + tail))
+    if eq:
+        q = model.query(*[_filterNode(model, f) for f in eq])
+        return QueryPlan(q, None, list(ineq) + list(memory_filters), sort)
+    q = model.query(*[_filterNode(model, f) for f in ineq])
+    return QueryPlan(q, None, memory_filters, sort)
+
+
+def _indexYaml(kind, fields):
+    lines = ['- kind: %s' % kind, '  properties:']
+    lines.extend('  - name: %s' % field for field in fields)
+    return '\n'.join(lines)
+
+
+def indexYaml():
+    """Return index.yaml content for the declared indexes."""
+    out = ['# Generated by planner.py from INDEXES; edit INDEXES and rerun',
+           '# "python planner.py > index.yaml" instead of editing this file.',
+           '', 'indexes:']
+    for kind in sorted(INDEXES):
+        for fields in INDEXES[kind]:
+            out.append('')
+            out.append(_indexYaml(kind, fields))
+    return '\n'.join(out) + '\n'
+
+
+if __name__ == '__main__':
+    print indexYaml(),
@@ -249,7 +249,7 @@ conferenceApp.controllers.controller('CreateConferenceCtrl',
  * @description
  * A controller used for the Show conferences page.
  */
-conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $log, oauth2Provider, HTTP_ERRORS) {
+conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $log, $http, oauth2Provider, HTTP_ERRORS) {
 
     /**
      * Holds the status if the query is being executed.
@@ -440,6 +440,17 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                 });
             }
         }
+        if (sendFilters.filters.length == 0) {
+            $scope.loadCatalog();
+            return;
+        }
+        $scope.runQueryConferences(sendFilters);
+    };
+
+    /**
+     * Invokes the conference.queryConferences API with the given filters.
+     */
+    $scope.runQueryConferences = function (sendFilters) {
         $scope.loading = true;
         gapi.client.conference.queryConferences(sendFilters).
             execute(function (resp) {
@@ -468,6 +479,34 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
             });
     }
 
+    /**
+     * Loads every page of the precomputed public catalog, which serves unfiltered browsing
+     * without a queryConferences call.
+     */
+    $scope.loadCatalog = function () {
+        var conferences = [];
+        var loadPage = function (page) {
+            $http.get('/catalog', {params: {page: page}}).
+                success(function (data) {
+                    conferences = conferences.concat(data.items);
+                    if (data.page + 1 < data.pageCount) {
+                        loadPage(data.page + 1);
+                    } else {
+                        $scope.loading = false;
+                        $scope.conferences = conferences;
+                        $scope.submitted = true;
+                    }
+                }).
+                error(function (data, status) {
+                    // No snapshot yet (503 until the first rebuild): query directly instead.
+                    $log.warn('Failed to load the conference catalog : ' + status);
+                    $scope.runQueryConferences({filters: []});
+                });
+        };
+        $scope.loading = true;
+        loadPage(0);
+    };
+
     /**
      * Invokes the conference.getConferencesCreated method.
      */
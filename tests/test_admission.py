@@ -0,0 +1,83 @@
+"""Tests for admission.py."""
+
+import unittest
+
+from google.appengine.ext import testbed
+
+import admission
+
+# long windows, so no test straddles a window boundary
+HOUR = 3600
+
+
+class AdmissionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_memcache_stub()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def _controller(self, **kwargs):
+        options = dict(rate=100, max_inflight=10, max_wait=0, lease=1,
+                       window=HOUR)
+        options.update(kwargs)
+        return admission.AdmissionController('test', **options)
+
+    def _admit(self, controller, key='k'):
+        with controller.admit(key):
+            pass
+
+    def test_rate_limit_sheds(self):
+        controller = self._controller(rate=3)
+        for _ in range(3):
+            self._admit(controller)
+        with self.assertRaises(admission.Rejected) as cm:
+            self._admit(controller)
+        self.assertEqual(cm.exception.reason, 'rate')
+        self.assertTrue(cm.exception.retry_after >= 1)
+
+    def test_rate_is_shared_through_leases(self):
+        # two instances leasing 2 tokens at a time from a bucket of 3
+        first = self._controller(rate=3, lease=2)
+        second = self._controller(rate=3, lease=2)
+        self._admit(first)
+        self._admit(second)
+        self._admit(first)
+        with self.assertRaises(admission.Rejected):
+            self._admit(second)
+
+    def test_inflight_limit_sheds(self):
+        controller = self._controller(max_inflight=1)
+        with controller.admit('k'):
+            with self.assertRaises(admission.Rejected) as cm:
+                self._admit(controller)
+            self.assertEqual(cm.exception.reason, 'inflight')
+            # other keys are limited separately
+            self._admit(controller, 'other')
+        self._admit(controller)
+
+    def test_waiting_for_a_slot_spends_no_tokens(self):
+        controller = self._controller(rate=2, max_inflight=1, max_wait=0.2)
+        with controller.admit('k'):
+            # polls for a slot several times before it is shed
+            with self.assertRaises(admission.Rejected) as cm:
+                self._admit(controller)
+            self.assertEqual(cm.exception.reason, 'inflight')
+        self._admit(controller)
+
+    def test_metrics(self):
+        controller = self._controller(rate=1)
+        self._admit(controller)
+        controller._flushed = 0
+        with self.assertRaises(admission.Rejected):
+            self._admit(controller)
+        counts = controller.metrics('k', minutes=1)[0][1]
+        self.assertEqual(counts['admitted'], 1)
+        self.assertEqual(counts['shed_rate'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
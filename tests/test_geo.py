@@ -0,0 +1,78 @@
+"""Tests for geo.py: city lookup, geohashes and covering cells."""
+
+import unittest
+
+import geo
+
+
+class LocateTest(unittest.TestCase):
+
+    def test_known_city(self):
+        self.assertEqual(geo.locate('London'), (51.5074, -0.1278))
+
+    def test_case_spacing_and_country(self):
+        self.assertEqual(geo.locate('  paris ,  FR'), geo.locate('Paris'))
+        self.assertEqual(geo.locate('Paris, FR'), (48.8566, 2.3522))
+
+    def test_first_part_of_name(self):
+        self.assertEqual(geo.locate('Portland, Oregon'),
+                         (45.5152, -122.6784))
+
+    def test_unknown_or_empty(self):
+        self.assertIsNone(geo.locate('Atlantis'))
+        self.assertIsNone(geo.locate(''))
+        self.assertIsNone(geo.locate(None))
+
+
+class GeohashTest(unittest.TestCase):
+
+    def test_encode(self):
+        # the example from the original geohash description
+        self.assertEqual(geo.encode(57.64911, 10.40744, 6), 'u4pruy')
+
+    def test_prefixes(self):
+        hashes = geo.prefixes(51.5074, -0.1278)
+        self.assertEqual(len(hashes),
+                         geo.MAX_PRECISION - geo.MIN_PRECISION + 1)
+        for shorter, longer in zip(hashes, hashes[1:]):
+            self.assertTrue(longer.startswith(shorter))
+
+
+class CoveringCellsTest(unittest.TestCase):
+
+    def _assertCovers(self, lat, lng, radius_km, max_cells=16):
+        cells = geo.coveringCells(lat, lng, radius_km, max_cells)
+        self.assertTrue(len(cells) <= max_cells or len(cells[0]) == 1)
+        self.assertIn(geo.encode(lat, lng, len(cells[0])), cells)
+        return cells
+
+    def test_small_radius_uses_fine_cells(self):
+        cells = self._assertCovers(51.5074, -0.1278, 2)
+        self.assertTrue(len(cells[0]) >= 4)
+
+    def test_large_radius_uses_coarse_cells(self):
+        cells = self._assertCovers(51.5074, -0.1278, 2000)
+        self.assertTrue(len(cells[0]) <= 2)
+
+    def test_antimeridian(self):
+        # both sides of the 180th meridian are covered
+        cells = self._assertCovers(-17.7, 179.9, 50)
+        precision = len(cells[0])
+        self.assertIn(geo.encode(-17.7, -179.9, precision), cells)
+
+    def test_pole(self):
+        self._assertCovers(89.9, 0.0, 100)
+
+
+class DistanceTest(unittest.TestCase):
+
+    def test_london_paris(self):
+        d = geo.distanceKm(51.5074, -0.1278, 48.8566, 2.3522)
+        self.assertAlmostEqual(d, 343.5, delta=1.0)
+
+    def test_same_point(self):
+        self.assertEqual(geo.distanceKm(10.0, 20.0, 10.0, 20.0), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""Tests for idpool.py."""
+
+import unittest
+
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+import idpool
+
+
+class Thing(ndb.Model):
+    pass
+
+
+class IdPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_ids_are_unique(self):
+        pool = idpool.IdPool(Thing, batch_size=5, low_water=2)
+        ids = []
+        for _ in range(23):
+            ids.append(pool.next())
+            ndb.eventloop.run()
+        self.assertEqual(len(set(ids)), len(ids))
+
+    def test_refills_in_the_background_below_low_water(self):
+        pool = idpool.IdPool(Thing, batch_size=5, low_water=2)
+        for _ in range(3):
+            pool.next()
+        self.assertFalse(pool._refilling)
+        pool.next()
+        self.assertTrue(pool._refilling)
+        ndb.eventloop.run()
+        self.assertFalse(pool._refilling)
+        self.assertEqual(len(pool._ids), 6)
+
+    def test_reserved_ids_are_not_reused(self):
+        parent = ndb.Key('Profile', 'u')
+        pool = idpool.IdPool(Thing, parent=parent, batch_size=5)
+        ids = set(pool.next() for _ in range(5))
+        for _ in range(5):
+            self.assertNotIn(Thing(parent=parent).put().id(), ids)
+
+
+class IdPoolsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_one_pool_per_parent(self):
+        pools = idpool.IdPools(Thing)
+        a, b = ndb.Key('Profile', 'a'), ndb.Key('Profile', 'b')
+        pools.next(a)
+        pools.next(b)
+        self.assertEqual(pools._pools[a].parent, a)
+        self.assertEqual(pools._pools[b].parent, b)
+
+    def test_least_recently_used_parent_is_evicted(self):
+        pools = idpool.IdPools(Thing, max_parents=2)
+        a, b, c = [ndb.Key('Profile', n) for n in 'abc']
+        pools.next(a)
+        pools.next(b)
+        pools.next(a)
+        pools.next(c)
+        self.assertEqual(list(pools._pools), [a, c])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+"""Tests for planner.py: which index a filter query is planned on, and
+the merge-join fallback when none is declared."""
+
+import unittest
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+import planner
+from models import Conference
+from models import Session
+
+
+def _filter(field, operator, value):
+    return {'field': field, 'operator': operator, 'value': value}
+
+
+class PlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.
+            PseudoRandomHRConsistencyPolicy(probability=1))
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+        planner._reported.clear()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def _session(self, title, location, session_type, duration=30):
+        Session(conference_key='c', title=title, location=location,
+                session_type=session_type, duration=duration).put()
+
+    def test_sort_alone_uses_builtin_index(self):
+        plan = planner.plan(Conference, [], 'name')
+        self.assertIsNone(plan.index)
+        self.assertIsNone(plan.sort)
+        self.assertEqual(plan.memory_filters, [])
+        self.assertFalse(planner._reported)
+
+    def test_equality_uses_declared_index(self):
+        plan = planner.plan(Conference, [_filter('city', '=', 'London')],
+                            'name')
+        self.assertEqual(plan.index, ('city', 'name'))
+        self.assertIsNone(plan.sort)
+
+    def test_inequality_uses_declared_index(self):
+        plan = planner.plan(Conference, [
+            _filter('maxAttendees', '>', 10),
+            _filter('dateBuckets', 'IN', ['m2026-10', 'm2026-11'])],
+            'name')
+        self.assertEqual(plan.index,
+                         ('dateBuckets', 'maxAttendees', 'name'))
+
+    def test_equality_on_sort_field_uses_builtin_index(self):
+        plan = planner.plan(Session, [_filter('title', '=', 'Keynote')],
+                            'title')
+        self.assertIsNone(plan.index)
+        self.assertIsNone(plan.sort)
+        self.assertFalse(planner._reported)
+
+    def test_missing_index_falls_back_to_merge_join(self):
+        self._session('b', 'Hall A', 'talk')
+        self._session('a', 'Hall A', 'talk')
+        self._session('c', 'Hall A', 'workshop')
+        self._session('d', 'Hall B', 'talk')
+
+        plan = planner.plan(Session, [_filter('location', '=', 'Hall A'),
+                                      _filter('session_type', '=', 'talk')],
+                            'title')
+        self.assertIsNone(plan.index)
+        self.assertEqual(plan.sort, ['title'])
+        self.assertIn(('Session', ('location', 'session_type', 'title')),
+                      planner._reported)
+        self.assertEqual([s.title for s in plan.run()], ['a', 'b'])
+
+    def test_fallback_applies_inequality_in_memory(self):
+        self._session('a', 'Hall A', 'talk', duration=90)
+        self._session('b', 'Hall A', 'talk', duration=30)
+        self._session('c', 'Hall A', 'talk', duration=60)
+        self._session('d', 'Hall B', 'talk', duration=90)
+
+        plan = planner.plan(Session, [_filter('location', '=', 'Hall A'),
+                                      _filter('duration', '>', 45)],
+                            'title')
+        self.assertIsNone(plan.index)
+        self.assertEqual(plan.sort, ['duration', 'title'])
+        self.assertEqual([s.title for s in plan.run()], ['c', 'a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
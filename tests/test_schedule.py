@@ -0,0 +1,68 @@
+"""Tests for the Schedule conflict index in models.py."""
+
+import unittest
+
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from models import Profile
+from models import Schedule
+from models import Session
+
+
+def _wssk(user_id, session_id):
+    return ndb.Key(Profile, user_id, Session, session_id).urlsafe()
+
+
+class ScheduleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub()
+        self.testbed.init_memcache_stub()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_add_reports_overlaps(self):
+        schedule = Schedule()
+        a, b, c = _wssk('u', 1), _wssk('u', 2), _wssk('u', 3)
+        self.assertEqual(schedule.add(a, 600, 660), [])
+        self.assertEqual(schedule.add(b, 660, 720), [])
+        self.assertEqual(schedule.add(c, 630, 690), [a, b])
+        self.assertEqual(sorted(schedule.conflicts),
+                         sorted([sorted([a, c]), sorted([b, c])]))
+
+    def test_long_session_found_by_bisect(self):
+        schedule = Schedule()
+        a, b = _wssk('u', 1), _wssk('u', 2)
+        schedule.add(a, 540, 1020)
+        self.assertEqual(schedule.add(b, 900, 960), [a])
+
+    def test_sessions_sharing_an_id_are_distinct(self):
+        # ids are allocated per organizer, so two organizers' sessions in
+        # one conference can share one
+        schedule = Schedule()
+        mine, theirs = _wssk('alice', 7), _wssk('bob', 7)
+        schedule.add(mine, 600, 660)
+        self.assertEqual(schedule.add(theirs, 630, 690), [mine])
+
+        schedule.remove(mine)
+        self.assertEqual([i[2] for i in schedule.intervals], [theirs])
+        self.assertEqual(schedule.conflicts, [])
+
+    def test_remove_drops_its_conflicts_only(self):
+        schedule = Schedule()
+        a, b, c = _wssk('u', 1), _wssk('u', 2), _wssk('u', 3)
+        schedule.add(a, 600, 660)
+        schedule.add(b, 630, 690)
+        schedule.add(c, 650, 700)
+        schedule.remove(a)
+        self.assertEqual(schedule.conflicts, [sorted([b, c])])
+        self.assertEqual(sorted(i[2] for i in schedule.intervals),
+                         sorted([b, c]))
+
+
+if __name__ == '__main__':
+    unittest.main()
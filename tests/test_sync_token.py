@@ -0,0 +1,60 @@
+"""Tests for the syncChanges token codec in api.py."""
+
+from datetime import datetime
+import unittest
+
+import endpoints
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+from api import ConferenceApi
+from models import Tombstone
+
+
+class SyncTokenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.
+            PseudoRandomHRConsistencyPolicy(probability=1))
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def _roundTrip(self, *args):
+        return ConferenceApi._decodeSyncToken(
+            ConferenceApi._encodeSyncToken(*args))
+
+    def test_full_sync_page_token(self):
+        Tombstone(kind='Conference', websafeKey='a').put()
+        Tombstone(kind='Conference', websafeKey='b').put()
+        _, cursor, more = Tombstone.query().fetch_page(1)
+        self.assertTrue(more)
+        start = datetime(2026, 10, 19, 9, 30, 15, 123456)
+
+        state = self._roundTrip(None, start, 1, cursor)
+        self.assertIsNone(state['since'])
+        self.assertEqual(state['start'], start)
+        self.assertEqual(state['kind'], 1)
+        self.assertEqual(state['cursor'].urlsafe(), cursor.urlsafe())
+
+    def test_delta_token(self):
+        since = datetime(2026, 10, 19, 9, 30, 15, 123456)
+        state = self._roundTrip(since)
+        self.assertEqual(state['since'], since)
+        self.assertIsNone(state['start'])
+        self.assertEqual(state['kind'], 0)
+        self.assertIsNone(state['cursor'])
+
+    def test_garbage_is_a_bad_request(self):
+        self.assertRaises(endpoints.BadRequestException,
+                          ConferenceApi._decodeSyncToken, 'not a token')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,7 +3,6 @@ import os
 import time
 import uuid
 
-from google.appengine.api import urlfetch
 from models import Profile
 
 import endpoints
@@ -19,6 +18,7 @@ def getUserId(user, id_type="email"):
 
     if id_type == "oauth":
         """A workaround implementation for getting userid."""
+        from google.appengine.api import urlfetch
         auth = os.getenv('HTTP_AUTHORIZATION')
         bearer, token = auth.split()
         token_type = 'id_token'
@@ -54,6 +54,20 @@ def getUserId(user, id_type="email"):
 
 # ---------------- added utils ----------------------
 
+def queueTask(url, params=None, **kwargs):
+    """Add a push task; taskqueue is only imported on first use to keep
+    it off the instance startup path."""
+    from google.appengine.api import taskqueue
+    return taskqueue.add(url=url, params=params, **kwargs)
+
+
+def queuePullTask(queue_name, payload, **kwargs):
+    """Add a pull task; taskqueue is imported lazily as in queueTask."""
+    from google.appengine.api import taskqueue
+    return taskqueue.Queue(queue_name).add(
+        taskqueue.Task(payload=payload, method='PULL'), **kwargs)
+
+
 def check_auth():
     user = endpoints.get_current_user()
     if not user:
@@ -69,6 +83,42 @@ ANNOUNCEMENT_TPL = ('Last chance to attend! The following conferences '
 MEMCACHE_SPEAKER_KEY = "FEATURED SPEAKER"
 FEATURED_SPEAKER = ("Featured speaker: %s. See them at: %s")
 
+MEMCACHE_FACETS_KEY = "CONFERENCE FACETS"
+FACETS_ID = "all"
+FACET_QUEUE = "facet-deltas"
+FACET_LEASE_BATCH = 1000        # most tasks one lease_tasks call returns
+
+MEMCACHE_CATALOG_KEY = "CATALOG"
+MEMCACHE_CATALOG_PAGE_KEY = "CATALOG PAGE %s"
+CATALOG_PAGE_SIZE = 100
+
+MEMCACHE_WISHLIST_OPS_KEY = "WISHLIST OPS %s"
+MEMCACHE_WISHLIST_FLUSH_KEY = "WISHLIST FLUSH %s"
+WISHLIST_FLUSH_SECONDS = 5
+# a user's buffer is written through once it holds this many ops, so a
+# memcache eviction loses at most this many acknowledged changes
+WISHLIST_MAX_BUFFERED_OPS = 10
+
+# registration admission control, per conference
+REGISTRATION_RATE = 20          # transaction attempts a second
+REGISTRATION_MAX_INFLIGHT = 5
+REGISTRATION_MAX_WAIT = 1.0     # seconds queued before shedding
+
+# most websafeKeys getConferences and getSessions take per call
+MAX_BATCH_KEYS = 100
+
+NEAR_DEFAULT_RADIUS_KM = 100
+NEAR_MAX_RADIUS_KM = 2000
+NEAR_PAGE_SIZE = 20
+# datastore limit on the values of one IN filter
+NEAR_MAX_CELLS = 30
+
+SYNC_PAGE_SIZE = 100
+# resend this much history to cover clock skew and eventual consistency
+SYNC_OVERLAP_SECONDS = 60
+TOMBSTONE_RETENTION_DAYS = 30
+SYNC_TIME_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 DEFAULTS = {
@@ -92,10 +142,17 @@ FIELDS = {
     'TOPIC': 'topics',
     'MONTH': 'month',
     'MAX_ATTENDEES': 'maxAttendees',
+    'START_DATE': 'startDate',
+}
+
+FACET_FIELDS = {
+    'CITY': 'city',
+    'TOPIC': 'topics',
+    'MONTH': 'month',
 }
 
 SESSIONFIELDS = {
-    'NAME': 'name',
+    'NAME': 'title',
     'TYPEOFSESSION': 'session_type',
     'SPEAKERNAME': 'speaker_name',
     'STARTTIME': 'start_time',
@@ -113,6 +170,23 @@ CONF_POST_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
 )
 
+CONF_VERSIONED_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+)
+
+VERSIONED_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    ifNoneMatch=messages.StringField(1),
+)
+
+FEATURED_SPEAKER_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    ifNoneMatch=messages.StringField(2),
+)
+
 SPEAKER_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
@@ -121,4 +195,10 @@ SPEAKER_REQUEST = endpoints.ResourceContainer(
 WISHLIST_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     sessionKey=messages.IntegerField(1),
+    websafeSessionKey=messages.StringField(2),
+)
+
+CONF_GROUP_REQUEST = endpoints.ResourceContainer(
+    GroupRegistrationForm,
+    websafeConferenceKey=messages.StringField(1),
 )